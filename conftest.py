@@ -0,0 +1,13 @@
+from contextlib import ExitStack
+
+_isolated = ExitStack()
+
+
+def pytest_sessionstart(session):
+    # До сбора тестов: сбор уже обращается к django.core.cache.cache
+    from yatube.testing import isolated_cache
+    _isolated.enter_context(isolated_cache())
+
+
+def pytest_sessionfinish(session, exitstatus):
+    _isolated.close()
@@ -0,0 +1,354 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+PICKLED = b'p'
+COMPRESSED = b'z'
+
+# Django создаёт свой экземпляр бэкенда на каждый поток, поэтому первый
+# уровень, как у LocMemCache, живёт на уровне модуля - один на LOCATION.
+_local_states = {}
+_local_states_lock = threading.Lock()
+
+
+class _LocalState:
+    """LRU первого уровня и счётчики, общие для всех потоков процесса."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.sets = 0
+        self.lock = threading.RLock()
+        self.stats = dict.fromkeys((
+            'local_hits', 'shared_hits', 'misses', 'sets',
+            'local_evictions', 'shared_culls', 'compressed',
+        ), 0)
+
+
+def _local_state(location):
+    with _local_states_lock:
+        state = _local_states.get(location)
+        if state is None:
+            state = _local_states[location] = _LocalState()
+        return state
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кэш без внешних сервисов.
+
+    Первый уровень - LRU в памяти процесса, общий для всех его потоков
+    и ограниченный суммарным размером значений в байтах. Второй, общий
+    для всех процессов - файл SQLite из LOCATION; без LOCATION работает
+    только первый.
+    Значения длиннее COMPRESS_MIN_LENGTH байт сжимаются zlib.
+    Число попаданий, промахов и вытеснений отдаёт `stats()`.
+
+    Чтобы процессы не расходились, запись живёт в памяти не дольше
+    LOCAL_MAX_AGE секунд, если общий уровень включён.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._max_bytes = int(options.get('MAX_BYTES', 64 * 1024 * 1024))
+        self._local_max_age = options.get('LOCAL_MAX_AGE', 5)
+        self._compress_min_length = int(
+            options.get('COMPRESS_MIN_LENGTH', 1024))
+        self._compress_level = int(options.get('COMPRESS_LEVEL', 6))
+        self._path = location or None
+        self._state = _local_state(location)
+        self._local = self._state.entries
+        self._lock = self._state.lock
+        self._stats = self._state.stats
+        self._connections = threading.local()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                local_entries=len(self._local),
+                local_bytes=self._state.bytes,
+                max_bytes=self._max_bytes,
+            )
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _dumps(self, value):
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(blob) >= self._compress_min_length:
+            self._count('compressed')
+            return COMPRESSED + zlib.compress(blob, self._compress_level)
+        return PICKLED + blob
+
+    def _loads(self, blob):
+        blob = bytes(blob)
+        if blob[:1] == COMPRESSED:
+            return pickle.loads(zlib.decompress(blob[1:]))
+        return pickle.loads(blob[1:])
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires, blob = entry
+            if expires is not None and expires <= time.time():
+                self._local_delete(key)
+                return None
+            self._local.move_to_end(key)
+            return blob
+
+    def _local_set(self, key, blob, expires):
+        if self._path and self._local_max_age is not None:
+            limit = time.time() + self._local_max_age
+            expires = limit if expires is None else min(expires, limit)
+        with self._lock:
+            self._local_delete(key)
+            if len(blob) > self._max_bytes:
+                return
+            self._local[key] = (expires, blob)
+            self._state.bytes += len(blob)
+            while self._state.bytes > self._max_bytes:
+                _, (_, evicted) = self._local.popitem(last=False)
+                self._state.bytes -= len(evicted)
+                self._stats['local_evictions'] += 1
+
+    def _local_delete(self, key):
+        with self._lock:
+            entry = self._local.pop(key, None)
+            if entry is not None:
+                self._state.bytes -= len(entry[1])
+            return entry is not None
+
+    def _db(self):
+        db = getattr(self._connections, 'db', None)
+        if db is None:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self._path, timeout=30,
+                                 isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+            )
+            db.execute(
+                'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)'
+            )
+            self._connections.db = db
+        return db
+
+    def _shared_get_many(self, keys):
+        if not self._path or not keys:
+            return {}
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self._db().execute(
+                'SELECT key, value, expires FROM cache WHERE key IN (%s) '
+                'AND (expires IS NULL OR expires > ?)'
+                % ', '.join('?' * len(chunk)),
+                [*chunk, time.time()],
+            )
+            for key, blob, expires in rows:
+                found[key] = (bytes(blob), expires)
+        return found
+
+    def _shared_set(self, db, key, blob, expires):
+        db.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) '
+            'VALUES (?, ?, ?)',
+            (key, blob, expires),
+        )
+
+    def _cull(self, db):
+        """Удалить истёкшие записи, а при переполнении - ближайшие к сроку."""
+        culled = db.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+        ).rowcount
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            culled += db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,),
+            ).rowcount
+        self._count('shared_culls', culled)
+
+    def _write(self, items, expires):
+        """Записать пары ключ-blob в оба уровня."""
+        for key, blob in items:
+            self._local_set(key, blob, expires)
+        self._count('sets', len(items))
+        if not self._path:
+            return
+        with self._transaction() as db:
+            for key, blob in items:
+                self._shared_set(db, key, blob, expires)
+            with self._lock:
+                self._state.sets += len(items)
+                cull = (self._state.sets
+                        >= self._max_entries // self._cull_frequency)
+                if cull:
+                    self._state.sets = 0
+            if cull:
+                self._cull(db)
+
+    def _transaction(self):
+        return _Transaction(self._db())
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        made = {}
+        for key in keys:
+            made_key = self.make_key(key, version=version)
+            self.validate_key(made_key)
+            made[made_key] = key
+        result = {}
+        missing = []
+        for made_key, key in made.items():
+            blob = self._local_get(made_key)
+            if blob is None:
+                missing.append(made_key)
+            else:
+                self._count('local_hits')
+                result[key] = self._loads(blob)
+        for made_key, (blob, expires) in self._shared_get_many(
+                missing).items():
+            self._count('shared_hits')
+            self._local_set(made_key, blob, expires)
+            result[made[made_key]] = self._loads(blob)
+        self._count('misses', len(made) - len(result))
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write([(key, self._dumps(value))],
+                    self.get_backend_timeout(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        items = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            items.append((key, self._dumps(value)))
+        self._write(items, self.get_backend_timeout(timeout))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        blob = self._dumps(value)
+        expires = self.get_backend_timeout(timeout)
+        if not self._path:
+            with self._lock:
+                if self._local_get(key) is not None:
+                    return False
+                self._write([(key, blob)], expires)
+                return True
+        with self._transaction() as db:
+            db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, time.time()),
+            )
+            added = db.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                (key, blob, expires),
+            ).rowcount
+        if added:
+            self._count('sets')
+            self._local_set(key, blob, expires)
+        return bool(added)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        if not self._path:
+            with self._lock:
+                blob = self._local_get(key)
+                if blob is None:
+                    raise ValueError("Key '%s' not found" % key)
+                value = self._loads(blob) + delta
+                self._local_set(key, self._dumps(value),
+                                self._local[key][0])
+                return value
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT value, expires FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = self._loads(row[0]) + delta
+            blob = self._dumps(value)
+            self._shared_set(db, key, blob, row[1])
+        self._local_set(key, blob, row[1])
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self.get_backend_timeout(timeout)
+        blob = self._local_get(key)
+        if blob is not None:
+            self._local_set(key, blob, expires)
+        if not self._path:
+            return blob is not None
+        with self._transaction() as db:
+            return bool(db.execute(
+                'UPDATE cache SET expires = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (expires, key, time.time()),
+            ).rowcount)
+
+    def has_key(self, key, version=None):
+        return self.get(key, version=version) is not None
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._local_delete(key)
+        if self._path:
+            with self._transaction() as db:
+                db.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+            self._state.bytes = 0
+        if self._path:
+            with self._transaction() as db:
+                db.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        """Соединение с SQLite живёт весь поток, закрывать его не нужно."""
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT: запись в общий уровень без гонок."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
@@ -0,0 +1,23 @@
+import re
+from urllib.parse import parse_qsl, urlencode
+
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+HOLE_PREFIX = b'<!--hole:'
+HOLE = re.compile(re.escape(HOLE_PREFIX) + rb'([\w./-]+)\?([^>]*?)-->')
+
+
+def hole_marker(template_name, params):
+    """Метка на месте персонального фрагмента в общей странице."""
+    return mark_safe(f'<!--hole:{template_name}?{urlencode(params)}-->')
+
+
+def fill_holes(request, content):
+    """Отрисовать фрагменты для текущего пользователя на месте меток."""
+    def render(match):
+        params = dict(parse_qsl(match.group(2).decode()))
+        return render_to_string(
+            match.group(1).decode(), params, request=request
+        ).encode()
+    return HOLE.sub(render, content)
@@ -0,0 +1,22 @@
+from .holes import HOLE_PREFIX, fill_holes
+
+
+class HoleFillingMiddleware:
+    """Дорисовывает персональные фрагменты в общих HTML-страницах.
+
+    Страница кэшируется одна на всех, а навигация, переключатель лент
+    и кнопки подписки подставляются для каждого запроса отдельно.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            not response.streaming
+            and response.get('Content-Type', '').startswith('text/html')
+            and HOLE_PREFIX in response.content
+        ):
+            response.content = fill_holes(request, response.content)
+        return response
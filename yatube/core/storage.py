@@ -0,0 +1,36 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, где имя файла - sha256 его содержимого.
+
+    Каталог из upload_to сохраняется: `posts/image.png` превращается
+    в `posts/ab/ab12...ef.png`. Одинаковые файлы хранятся один раз,
+    а раз у них одно имя, sorl нарезает для них одни и те же превью.
+    Удалять такие файлы вместе с постом нельзя - их подбирает
+    команда `gc_images`. Повторная загрузка обновляет время изменения
+    файла, чтобы сборщик не удалил его в пределах `--grace`.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        digest = digest.hexdigest()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super()._save(name, content)
@@ -0,0 +1,10 @@
+from django import template
+
+from core.holes import hole_marker
+
+register = template.Library()
+
+
+@register.simple_tag
+def hole(template_name, **params):
+    return hole_marker(template_name, params)
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+class CappedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет любую загрузку во временный файл, но не больше UPLOAD_MAX_BYTES.
+
+    Всё сверх лимита отбрасывается, а `size` файла остаётся настоящим,
+    так что форма видит, что файл слишком большой, а диск и память
+    воркера не тратятся на остаток.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_BYTES:
+            return None
+        return super().receive_data_chunk(raw_data, start)
@@ -1,6 +1,19 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
 
+from . import caching
 from .models import Group, Post
+from .paginators import CachedCountPaginator
+from .search import filter_posts
+
+
+class PostActionForm(ActionForm):
+    group = forms.ModelChoiceField(
+        Group.objects.all(),
+        required=False,
+        label='Группа',
+    )
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -12,9 +25,71 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
     empty_value_display = '-пусто-'
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    action_form = PostActionForm
+    actions = ('move_to_group',)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Искать по полнотекстовому индексу, а не LIKE по всей таблице."""
+        if not search_term:
+            return queryset, False
+        return filter_posts(queryset, search_term), False
+
+    def group_choices(self, request):
+        """Список групп читается один раз на запрос, а не на каждую строку."""
+        if not hasattr(request, '_group_choices'):
+            request._group_choices = [
+                ('', '---------'),
+                *Group.objects.values_list('pk', 'title'),
+            ]
+        return request._group_choices
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs)
+        if db_field.name == 'group' and formfield is not None:
+            formfield.choices = self.group_choices(request)
+        return formfield
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        action_form = getattr(response, 'context_data', {}).get(
+            'action_form')
+        if action_form is not None:
+            action_form.fields['group'].choices = self.group_choices(request)
+        return response
+
+    def move_to_group(self, request, queryset):
+        """Перенести выбранные посты в группу одним UPDATE."""
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        if not form.is_valid():
+            self.message_user(request, 'Неизвестная группа', messages.ERROR)
+            return
+        group = form.cleaned_data['group']
+        queryset = queryset.order_by()
+        group_ids = set(
+            queryset.values_list('group_id', flat=True).distinct())
+        usernames = set(
+            queryset.values_list('author__username', flat=True).distinct())
+        moved = queryset.update(group=group)
+        if group is not None:
+            group_ids.add(group.pk)
+        slugs = Group.objects.filter(pk__in=group_ids).values_list(
+            'slug', flat=True)
+        caching.bump(
+            'posts',
+            *(f'group:{slug}' for slug in slugs),
+            *(f'author:{username}' for username in usernames),
+        )
+        self.message_user(request, f'Перенесено постов: {moved}')
+    move_to_group.short_description = 'Перенести в группу'
 
 
 admin.site.register(Post, PostAdmin)
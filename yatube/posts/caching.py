@@ -0,0 +1,304 @@
+import copy
+import hashlib
+import random
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import Group, Post, User
+
+GENERATION_KEY = 'posts:generation:{}'
+MODIFIED_KEY = 'posts:modified:{}'
+POST_SCOPES_KEY = 'posts:post-scopes:{}'
+PAGE_KEY = 'posts:page:{}'
+LOCK_KEY = '{}:lock'
+LOCK_POLL_INTERVAL = 0.05
+
+
+def scope_key(template, scope):
+    """Ключ области: слаг или имя пользователя в ключе - только хэшем."""
+    return template.format(hashlib.md5(scope.encode()).hexdigest())
+
+
+def get_generations(scopes):
+    """Текущие поколения областей кэша одним обращением к кэшу.
+
+    Отсутствующее поколение заводится от текущего времени, поэтому
+    после вытеснения или истечения ключа старые страницы не совпадут
+    с новыми. Ключи живут FEED_GENERATION_TIMEOUT: поколения областей,
+    которых нет (запросы к несуществующим группам и профилям), сами
+    уходят из кэша.
+    """
+    keys = [scope_key(GENERATION_KEY, scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), settings.FEED_GENERATION_TIMEOUT)
+        found.update(cache.get_many(missing))
+    return [found.get(key, 0) for key in keys]
+
+
+def get_validators(scopes):
+    """Поколения областей и время последнего изменения любой из них.
+
+    Обычно это одно обращение к кэшу. Время неизвестной области
+    заводится текущим: клиент получит страницу целиком, а не
+    устаревший 304.
+    """
+    generation_keys = [scope_key(GENERATION_KEY, scope) for scope in scopes]
+    modified_keys = [scope_key(MODIFIED_KEY, scope) for scope in scopes]
+    found = cache.get_many(generation_keys + modified_keys)
+    if any(key not in found for key in generation_keys):
+        found.update(zip(generation_keys, get_generations(scopes)))
+    now = time.time()
+    for key in modified_keys:
+        if key not in found:
+            cache.add(key, now, settings.FEED_GENERATION_TIMEOUT)
+            found[key] = now
+    return (
+        [found[key] for key in generation_keys],
+        max((found[key] for key in modified_keys), default=now),
+    )
+
+
+def bump(*scopes):
+    """Сменить поколение областей: их страницы в кэше устаревают."""
+    for scope in scopes:
+        key = scope_key(GENERATION_KEY, scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), settings.FEED_GENERATION_TIMEOUT)
+    cache.set_many(
+        {scope_key(MODIFIED_KEY, scope): time.time() for scope in scopes},
+        settings.FEED_GENERATION_TIMEOUT,
+    )
+
+
+def bump_post(post, group_ids=()):
+    """Сбросить ленты, где виден пост: общую, его групп и его автора.
+
+    Заодно запоминаются области страницы самого поста - их читает
+    `post_scopes`, не обращаясь к базе.
+    """
+    group_ids = {post.group_id, *group_ids} - {None}
+    slugs = dict(
+        Group.objects.filter(pk__in=group_ids).values_list('pk', 'slug'))
+    if type(post).author.is_cached(post):
+        username = post.author.username
+    else:
+        username = User.objects.filter(pk=post.author_id).values_list(
+            'username', flat=True).first()
+    bump('posts', f'author:{username}',
+         *(f'group:{slug}' for slug in slugs.values()))
+    scopes = [f'post:{post.pk}', f'author:{username}']
+    if post.group_id in slugs:
+        scopes.append(f'group:{slugs[post.group_id]}')
+    cache.set(POST_SCOPES_KEY.format(post.pk), scopes,
+              settings.FEED_GENERATION_TIMEOUT)
+
+
+def post_scopes(request, post_id):
+    """Области страницы поста: сам пост, его автор и группа."""
+    scopes = cache.get(POST_SCOPES_KEY.format(post_id))
+    if scopes is not None:
+        return scopes
+    row = Post.objects.filter(pk=post_id).values_list(
+        'author__username', 'group__slug').first()
+    if row is None:
+        return None
+    username, slug = row
+    scopes = [f'post:{post_id}', f'author:{username}']
+    if slug:
+        scopes.append(f'group:{slug}')
+    cache.set(POST_SCOPES_KEY.format(post_id), scopes,
+              settings.FEED_GENERATION_TIMEOUT)
+    return scopes
+
+
+def page_key(request, generations):
+    raw = f'{request.get_full_path()}|{generations}'
+    return PAGE_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+_placeholders = ContextVar('feed_placeholders', default=None)
+
+
+def skip_page_cache():
+    """Не кэшировать страницу, которая сейчас рисуется.
+
+    Вызывается, когда вместо превью выводится заглушка: такая страница
+    устарела бы, как только превью будет готово.
+    """
+    seen = _placeholders.get()
+    if seen is not None:
+        seen.append(True)
+
+
+def _render(view, request, args, kwargs):
+    """Ответ представления и признак, можно ли положить его в кэш."""
+    seen = []
+    token = _placeholders.set(seen)
+    try:
+        return view(request, *args, **kwargs), not seen
+    finally:
+        _placeholders.reset(token)
+
+
+def _store(key, response):
+    """Положить страницу в кэш со случайно растянутым сроком свежести."""
+    if response.status_code != 200 or response.streaming:
+        return
+    timeout = settings.FEED_CACHE_TIMEOUT * random.uniform(
+        1 - settings.FEED_CACHE_JITTER, 1 + settings.FEED_CACHE_JITTER
+    )
+    cache.set(
+        key,
+        (response.content, time.time() + timeout),
+        timeout + settings.FEED_CACHE_GRACE,
+    )
+
+
+def _acquire(key):
+    return cache.add(LOCK_KEY.format(key), True,
+                     settings.FEED_CACHE_LOCK_TIMEOUT)
+
+
+def _release(key):
+    cache.delete(LOCK_KEY.format(key))
+
+
+def _wait(key):
+    """Дождаться страницы, которую пересчитывает другой запрос."""
+    deadline = time.monotonic() + settings.FEED_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def _refresh(view, request, args, kwargs, key):
+    try:
+        response, cacheable = _render(view, request, args, kwargs)
+        if cacheable:
+            _store(key, response)
+    finally:
+        _release(key)
+
+
+def _refresh_later(view, request, args, kwargs, key):
+    """Обновить устаревшую страницу после ответа, в отдельном потоке."""
+    if not settings.FEED_CACHE_BACKGROUND:
+        _refresh(view, request, args, kwargs, key)
+        return
+
+    def run():
+        try:
+            _refresh(view, copy.copy(request), args, kwargs, key)
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def cache_feed(*scopes):
+    """Кэшировать страницу ленты до смены поколения её областей.
+
+    Области задаются шаблонами из аргументов представления, например
+    `cache_feed('group:{slug}')`. Запись поста меняет поколения только
+    затронутых лент, поэтому страницы можно хранить часами. Страница
+    одна на всех пользователей: персональные фрагменты вынесены в
+    `{% hole %}` и дорисовываются HoleFillingMiddleware.
+
+    Пересчитывает страницу только один запрос: остальные ждут его
+    результата или, пока не истёк `FEED_CACHE_GRACE`, получают
+    устаревшую копию, а свежая строится в фоне. Срок свежести
+    случайно растянут на `FEED_CACHE_JITTER`, чтобы записи не
+    истекали разом. Страница с заглушками вместо превью в кэш не
+    кладётся - см. `skip_page_cache`.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            generations = get_generations(
+                [scope.format(**kwargs) for scope in scopes]
+            )
+            key = page_key(request, generations)
+            entry = cache.get(key)
+            locked = False
+            if entry is None:
+                locked = _acquire(key)
+                if not locked:
+                    entry = _wait(key)
+            if entry is not None:
+                content, fresh_until = entry
+                if time.time() >= fresh_until and _acquire(key):
+                    _refresh_later(view, request, args, kwargs, key)
+                return HttpResponse(content)
+            try:
+                response, cacheable = _render(view, request, args, kwargs)
+                if cacheable:
+                    _store(key, response)
+            finally:
+                if locked:
+                    _release(key)
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_page(*scopes, extra_scopes=None):
+    """Отвечать 304 Not Modified, пока не изменились области страницы.
+
+    Области задаются как в `cache_feed`; `extra_scopes(request, **kwargs)`
+    может добавить вычисляемые или вернуть None - тогда страница
+    отдаётся как обычно. К ним всегда добавляется область `user:<id>`
+    зрителя: от неё зависят его персональные фрагменты.
+
+    ETag складывается из поколений областей, адреса и пользователя,
+    Last-Modified - время последней смены областей. Всё это читается
+    из кэша до запроса ленты и отрисовки шаблона.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            page_scopes = [scope.format(**kwargs) for scope in scopes]
+            if extra_scopes is not None:
+                extra = extra_scopes(request, **kwargs)
+                if extra is None:
+                    return view(request, *args, **kwargs)
+                page_scopes += extra
+            user = request.user
+            if user.is_authenticated:
+                page_scopes.append(f'user:{user.pk}')
+            generations, modified = get_validators(page_scopes)
+            raw = (f'{request.get_full_path()}|{generations}|'
+                   f'{user.pk}|{user.get_username()}')
+            etag = quote_etag(hashlib.md5(raw.encode()).hexdigest())
+            last_modified = int(modified)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                response['Last-Modified'] = http_date(last_modified)
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,76 @@
+import hashlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template import engines
+from django.template.backends.jinja2 import Jinja2
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .images import prefetch_thumbnails
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+# Всё, что попадает в карточку: сам шаблон и то, что он подключает
+CARD_TEMPLATES = {
+    'django': (CARD_TEMPLATE, 'posts/includes/post_image.html'),
+    'jinja2': (CARD_TEMPLATE, 'posts/macros.html'),
+}
+CARD_KEY = 'posts:card:{}:{}:{}'
+
+
+def _source(using, name):
+    engine = engines[using]
+    if isinstance(engine, Jinja2):
+        return engine.env.loader.get_source(engine.env, name)[0]
+    return engine.get_template(name).template.source
+
+
+@lru_cache(maxsize=None)
+def template_version(using='django'):
+    """Хэш исходников карточки: правка шаблона сама сбрасывает кэш."""
+    digest = hashlib.md5(using.encode())
+    for name in CARD_TEMPLATES[using]:
+        digest.update(_source(using, name).encode())
+    return digest.hexdigest()[:8]
+
+
+def card_key(post, using='django'):
+    return CARD_KEY.format(
+        post.pk, post.updated_at.timestamp(), template_version(using))
+
+
+def render_card(post, using='django'):
+    return mark_safe(
+        render_to_string(CARD_TEMPLATE, {'post': post}, using=using))
+
+
+def _is_pending(post):
+    return bool(post.image) and getattr(post, 'thumbnails', {}).get(
+        'card', (False, None))[0]
+
+
+def prefetch_cards(posts, using='django'):
+    """Достать карточки всех постов страницы одним get_many.
+
+    Карточка хранится по (id, updated_at, версия шаблонов движка
+    `using`), поэтому правка поста просто даёт новый ключ. Недостающие карточки
+    рисуются и кладутся в кэш одним set_many; превью для них
+    собирает `prefetch_thumbnails`. Карточка с заглушкой вместо
+    превью не кэшируется - превью вот-вот будет готово.
+    """
+    posts = list(posts)
+    keys = {card_key(post, using): post for post in posts}
+    found = cache.get_many(keys)
+    missing = [post for key, post in keys.items() if key not in found]
+    prefetch_thumbnails(missing)
+    rendered = {}
+    for key, post in keys.items():
+        if key in found:
+            post.card = mark_safe(found[key])
+            continue
+        post.card = render_card(post, using)
+        if not _is_pending(post):
+            rendered[key] = str(post.card)
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_TIMEOUT)
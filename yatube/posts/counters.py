@@ -0,0 +1,93 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def _count(queryset, field, outer):
+    """Подзапрос: число строк queryset, где `field` равно `outer` снаружи."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef(outer)})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0)
+    )
+
+
+def user_counters(outer='pk'):
+    return {
+        'posts_count': _count(Post.objects.all(), 'author', outer),
+        'followers_count': _count(Follow.objects.all(), 'author', outer),
+        'following_count': _count(Follow.objects.all(), 'user', outer),
+    }
+
+
+def post_counters(outer='pk'):
+    return {
+        'comments_count': _count(Comment.objects.all(), 'post', outer),
+    }
+
+
+def _create_stats(user_id):
+    counters = User.objects.filter(pk=user_id).values(**user_counters())
+    return UserStats.objects.get_or_create(
+        user_id=user_id, defaults=counters.first() or {}
+    )
+
+
+def get_stats(user):
+    """Счётчики пользователя; недостающая строка создаётся по факту."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return _create_stats(user.pk)[0]
+
+
+def change_user_counter(user_id, field, delta):
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta}
+    )
+    if updated or delta < 0:
+        # Недостающую строку get_stats() посчитает заново, а при каскадном
+        # удалении пользователя её уже нельзя создавать
+        return
+    if not _create_stats(user_id)[1]:
+        change_user_counter(user_id, field, delta)
+
+
+def change_comments_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta
+    )
+
+
+def reconcile(users=None, posts=None):
+    """Пересчитать счётчики; вернуть число исправленных значений.
+
+    Запросы `users` и `posts` ограничивают пересчёт, например, только
+    что импортированным; по умолчанию пересчитывается всё.
+    """
+    stats = UserStats.objects.all()
+    if users is None:
+        users = User.objects.all()
+    else:
+        stats = stats.filter(user__in=users)
+    if posts is None:
+        posts = Post.objects.all()
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=user_id) for user_id in users.filter(
+            stats__isnull=True).values_list('pk', flat=True).iterator()),
+        batch_size=500,
+    )
+    fixed = 0
+    for queryset, counters in ((stats, user_counters('user')),
+                               (posts, post_counters())):
+        for field, actual in counters.items():
+            fixed += queryset.exclude(**{field: actual}).update(
+                **{field: actual}
+            )
+    return fixed
@@ -0,0 +1,54 @@
+import csv
+import json
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+FIELDS = ('id', 'text', 'pub_date', 'author', 'group', 'image')
+COLUMNS = (
+    'id', 'text', 'pub_date', 'author__username', 'group__slug', 'image')
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class _Echo:
+    """Файл для csv.writer, который просто возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, chunk_size=None):
+    """Строки выгрузки; в памяти не больше одной пачки из chunk_size."""
+    rows = queryset.order_by('pk').values_list(*COLUMNS).iterator(
+        chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+    for post_id, text, pub_date, author, group, image in rows:
+        yield post_id, text, pub_date.isoformat(), author, group, image
+
+
+def export_lines(queryset, file_format, chunk_size=None):
+    """Выгрузка построчно в JSON Lines или CSV."""
+    rows = export_rows(queryset, chunk_size)
+    if file_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
+        return
+    for row in rows:
+        yield json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + '\n'
+
+
+def export_response(queryset, file_format, filename):
+    if file_format not in CONTENT_TYPES:
+        file_format = 'jsonl'
+    response = StreamingHttpResponse(
+        export_lines(queryset, file_format),
+        content_type=CONTENT_TYPES[file_format],
+    )
+    response['Content-Disposition'] = (
+        f"attachment; filename*=UTF-8''{quote(filename)}.{file_format}")
+    return response
@@ -1,6 +1,10 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
 
+from .images import downscale_upload
 from .models import Comment, Post
+from .validators import validate_image_pixels, validate_upload_size
 
 
 class PostForm(forms.ModelForm):
@@ -16,6 +20,30 @@ class PostForm(forms.ModelForm):
             "group": ('Группа, к которой будет относиться пост'),
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            validate_upload_size(image)
+            validate_image_pixels(image)
+            image = downscale_upload(image)
+        return image
+
+    def full_clean(self):
+        """Слишком большой файл обрезан обработчиком загрузки.
+
+        Поэтому ImageField может счесть его битым раньше clean_image;
+        пользователю важнее узнать про размер.
+        """
+        super().full_clean()
+        upload = self.files.get(self.add_prefix('image'))
+        if upload is None:
+            return
+        try:
+            validate_upload_size(upload)
+        except ValidationError as error:
+            self._errors['image'] = self.error_class(error.messages)
+            self.cleaned_data.pop('image', None)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,322 @@
+import json
+import logging
+import multiprocessing
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import \
+    KVStore as CachedDBKVStore
+from sorl.thumbnail.models import KVStore
+
+from . import caching
+from .models import Post
+from .workers import init_thumbnail_worker
+
+PENDING_KEY = 'posts:thumbnail:pending:{}'
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Форматы, которые Pillow читает, но пишет не всеми версиями: MPO с
+# камер Pillow 8 записать не может, а первый кадр MPO - обычный JPEG
+SAVE_FORMATS = {'MPO': 'JPEG'}
+
+
+def _save_format(image_format, mode):
+    """Формат, в котором Pillow точно запишет уменьшенный оригинал."""
+    image_format = SAVE_FORMATS.get(image_format, image_format)
+    Image.init()
+    if image_format in Image.SAVE:
+        return image_format
+    return 'JPEG' if mode in ('RGB', 'L', 'CMYK') else 'PNG'
+
+
+def downscale_upload(upload):
+    """Уменьшить слишком большой оригинал до IMAGE_MAX_SIDE по длинной стороне.
+
+    JPEG сразу декодируется уменьшенным в 2-8 раз через draft(),
+    остальные форматы сначала ужимаются reduce() в целое число раз,
+    и только остаток доводится точным resize. Результат пишется во
+    временный файл, а не в память, в формате оригинала или, если его
+    Pillow не пишет, в ближайшем записываемом.
+    """
+    max_side = settings.IMAGE_MAX_SIDE
+    upload.seek(0)
+    with Image.open(upload) as image:
+        if max(image.size) <= max_side:
+            upload.seek(0)
+            return upload
+        image_format = _save_format(image.format, image.mode)
+        scale = max_side / max(image.size)
+        target = (
+            max(1, round(image.width * scale)),
+            max(1, round(image.height * scale)),
+        )
+        exif = image.info.get('exif')
+        image.draft(image.mode, target)
+        factor = min(image.width // target[0], image.height // target[1])
+        resized = image.reduce(factor) if factor > 1 else image
+        resized = resized.resize(target, Image.LANCZOS)
+    output = tempfile.TemporaryFile()
+    options = {'exif': exif} if exif else {}
+    resized.save(output, image_format, **options)
+    size = output.tell()
+    output.seek(0)
+    return UploadedFile(
+        output, upload.name, upload.content_type, size, upload.charset)
+
+
+def _get_executor(broken=None):
+    global _executor
+    with _executor_lock:
+        if _executor is None or _executor is broken:
+            _executor = ProcessPoolExecutor(
+                settings.THUMBNAIL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_thumbnail_worker,
+            )
+        return _executor
+
+
+def shutdown_thumbnail_workers():
+    """Дождаться поставленных нарезок и остановить процессы пула.
+
+    Следующая `queue_thumbnails` заведёт пул заново.
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def render_thumbnails(name, media_root=None):
+    """Нарезать превью из THUMBNAIL_PRESETS и варианты srcset для `name`.
+
+    Исходник декодируется один раз на все размеры; готовые файлы
+    пропускаются. `media_root` передаёт каталог медиа воркеру, чьи
+    настройки могут отличаться от настроек основного процесса.
+    """
+    image_storage = Post._meta.get_field('image').storage
+    thumbnail_storage = default.storage
+    if media_root and media_root != settings.MEDIA_ROOT:
+        image_storage = type(image_storage)(location=media_root)
+        thumbnail_storage = FileSystemStorage(location=media_root)
+    source = ImageFile(name, image_storage)
+    source_image = None
+    try:
+        for geometry, options in thumbnail_jobs(name):
+            options = thumbnail_options(source, options)
+            thumbnail = ImageFile(
+                default.backend._get_thumbnail_filename(
+                    source, geometry, options),
+                thumbnail_storage
+            )
+            if thumbnail.exists():
+                continue
+            if source_image is None:
+                source_image = default.engine.get_image(source)
+            options['image_info'] = default.engine.get_image_info(
+                source_image)
+            default.backend._create_thumbnail(
+                source_image, geometry, options, thumbnail)
+    finally:
+        if source_image is not None:
+            default.engine.cleanup(source_image)
+
+
+def thumbnail_jobs(image):
+    """Геометрия и опции sorl всех превью картинки: пресеты и варианты."""
+    return list(settings.THUMBNAIL_PRESETS.values()) + [
+        (geometry, options)
+        for _, _, geometry, options in variant_specs(image)
+    ]
+
+
+def variant_specs(image):
+    """Ширина, формат, геометрия и опции sorl каждого варианта srcset."""
+    geometry, options = settings.THUMBNAIL_PRESETS[
+        settings.IMAGE_VARIANT_PRESET]
+    width, height = map(int, geometry.split('x'))
+    source_format = default.backend._get_format(ImageFile(image))
+    # None - формат исходника; для WebP-загрузки он совпал бы с WEBP
+    formats = dict.fromkeys(
+        image_format or source_format
+        for image_format in settings.IMAGE_VARIANT_FORMATS
+    )
+    for image_format in formats:
+        for variant_width in settings.IMAGE_VARIANT_WIDTHS:
+            variant_height = round(height * variant_width / width)
+            yield (
+                variant_width,
+                image_format,
+                f'{variant_width}x{variant_height}',
+                dict(options, format=image_format),
+            )
+
+
+def build_manifest(image):
+    """JSON-манифест вариантов: {mime: [[ширина, имя файла], ...]}."""
+    if not image:
+        return ''
+    sources = {}
+    for width, image_format, geometry, options in variant_specs(image):
+        sources.setdefault(MIME_TYPES[image_format], []).append(
+            [width, thumbnail_file(image, geometry, options).name]
+        )
+    return json.dumps(sources)
+
+
+def _cache():
+    """Кэш метаданных sorl; флаги лежат там же, чтобы читать всё разом."""
+    return getattr(default.kvstore, 'cache', cache)
+
+
+def is_pending(image):
+    return bool(image) and bool(_cache().get(PENDING_KEY.format(image.name)))
+
+
+def thumbnail_options(source, options):
+    """Опции превью, дополненные так же, как их дополняет sorl."""
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def thumbnail_file(image, geometry, options):
+    """ImageFile превью, как его назовёт sorl, без обращения к хранилищу."""
+    source = ImageFile(image)
+    return ImageFile(
+        default.backend._get_thumbnail_filename(
+            source, geometry, thumbnail_options(source, options)),
+        default.storage
+    )
+
+
+def remember_source_size(post):
+    """Записать в kvstore sorl размер исходника из полей поста.
+
+    Тогда sorl, найдя готовый файл превью, не открывает исходник
+    ради его размера.
+    """
+    if post.image and post.image_width and post.image_height:
+        source = ImageFile(post.image)
+        source.set_size((post.image_width, post.image_height))
+        default.kvstore.get_or_set(source)
+
+
+def prefetch_thumbnails(posts, preset='card'):
+    """Разом достать метаданные превью для всех постов страницы.
+
+    Флаги «в работе» и записи kvstore читаются одним get_many, а то,
+    чего нет в кэше, - одним запросом к таблице kvstore. Результат
+    кладётся в `post.thumbnails[preset]` как пара (в работе, превью);
+    превью None значит, что sorl нарежет его при отрисовке. Постам
+    с манифестом вариантов kvstore не нужен, для них читается только
+    флаг.
+    """
+    posts = [post for post in posts if post.image]
+    if not posts:
+        return
+    geometry, options = settings.THUMBNAIL_PRESETS[preset]
+    keys = {}
+    for post in posts:
+        kv_key = None
+        if not (post.image_variants
+                and preset == settings.IMAGE_VARIANT_PRESET):
+            kv_key = add_prefix(
+                thumbnail_file(post.image, geometry, options).key)
+        keys[post] = (PENDING_KEY.format(post.image.name), kv_key)
+    kv_cache = _cache()
+    found = kv_cache.get_many(
+        [key for pair in keys.values() for key in pair if key])
+    missing = [
+        kv_key for _, kv_key in keys.values()
+        if kv_key and kv_key not in found
+    ]
+    if missing and isinstance(default.kvstore, CachedDBKVStore):
+        stored = dict(
+            KVStore.objects.filter(key__in=missing).values_list('key', 'value')
+        )
+        fetched = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+        kv_cache.set_many(fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(fetched)
+    for post, (pending_key, kv_key) in keys.items():
+        value = found.get(kv_key)
+        thumbnail = None
+        if value and value is not EMPTY_VALUE:
+            thumbnail = deserialize_image_file(value)
+        if not hasattr(post, 'thumbnails'):
+            post.thumbnails = {}
+        post.thumbnails[preset] = (bool(found.get(pending_key)), thumbnail)
+
+
+def queue_thumbnails(post):
+    """Записать манифест вариантов и поставить нарезку в очередь.
+
+    Манифест считается по одним именам файлов, поэтому пишется сразу.
+    Пока задача не выполнена, в кэше лежит флаг и шаблоны показывают
+    заглушку, а страницы с ней не кэшируются. Когда задача завершена,
+    флаг снимается и ленты поста сбрасываются. Ошибка воркера попадает
+    в лог; `render_thumbnails` пропускает готовые файлы, так что нарезку
+    можно просто повторить. THUMBNAIL_WORKERS = 0 нарезает превью
+    сразу, в текущем процессе.
+    """
+    post.image_variants = build_manifest(post.image)
+    Post.objects.filter(pk=post.pk).update(
+        image_variants=post.image_variants)
+    if not post.image:
+        return None
+    name = post.image.name
+    if not settings.THUMBNAIL_WORKERS:
+        render_thumbnails(name)
+        return None
+    key = PENDING_KEY.format(name)
+    # области считаются здесь: в потоке обратного вызова базы нет
+    scopes = ['posts', *(caching.post_scopes(None, post.pk) or ())]
+    _cache().set(key, True, settings.THUMBNAIL_PENDING_TIMEOUT)
+    executor = _get_executor()
+    try:
+        future = executor.submit(render_thumbnails, name, settings.MEDIA_ROOT)
+    except BrokenProcessPool:
+        future = _get_executor(broken=executor).submit(
+            render_thumbnails, name, settings.MEDIA_ROOT)
+
+    def done(future):
+        if future.exception() is not None:
+            logger.error('Thumbnails for %s failed', name,
+                         exc_info=future.exception())
+        _cache().delete(key)
+        caching.bump(*scopes)
+
+    future.add_done_callback(done)
+    return future
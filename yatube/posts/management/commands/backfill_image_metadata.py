@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.utils import chunks
+from posts.workers import image_metadata_for_path
+
+FIELDS = ('image_width', 'image_height', 'image_size', 'image_hash')
+
+
+class Command(BaseCommand):
+    help = 'Заполняет размеры, вес и хэш картинок у уже загруженных постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='число процессов, читающих файлы',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='сколько постов обновлять одним запросом',
+        )
+        parser.add_argument(
+            '--all', action='store_true', dest='recompute',
+            help='пересчитать и уже заполненные посты',
+        )
+
+    def handle(self, *args, workers, batch_size, recompute, **options):
+        posts = Post.objects.exclude(image='').order_by('pk')
+        if not recompute:
+            posts = posts.filter(image_hash='')
+        storage = Post._meta.get_field('image').storage
+        started = time.monotonic()
+        updated = missing = 0
+        with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn')
+        ) as pool:
+            rows = posts.values_list('pk', 'image').iterator()
+            for batch in chunks(rows, batch_size):
+                results = pool.map(
+                    image_metadata_for_path,
+                    [storage.path(name) for _, name in batch],
+                    chunksize=max(1, len(batch) // (workers * 4)),
+                )
+                changed = []
+                for (pk, _), metadata in zip(batch, results):
+                    if metadata is None:
+                        missing += 1
+                        continue
+                    changed.append(Post(pk=pk, **dict(zip(FIELDS, metadata))))
+                Post.objects.bulk_update(changed, FIELDS)
+                updated += len(changed)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено постов: {updated}, файлов не найдено: {missing}, '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
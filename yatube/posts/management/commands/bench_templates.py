@@ -0,0 +1,118 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.template.loader import render_to_string
+from django.template.loaders import cached
+from django.test import RequestFactory
+
+from posts.cards import prefetch_cards
+from posts.counters import get_stats
+from posts.forms import CommentForm
+from posts.images import prefetch_thumbnails
+from posts.models import Post
+from posts.paginators import CursorPaginator, paginate
+
+ENGINES = ('django', 'jinja2')
+# Карточки лент: без кэша их рисует сам шаблон, из кэша - готовые
+CARD_STATES = ('cold', 'warm')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время отрисовки лент и страницы поста '
+            'шаблонами Django и Jinja2; ленты - с карточками без кэша '
+            'и из кэша')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=200,
+            help='сколько раз рисовать каждую страницу',
+        )
+
+    def handle(self, *args, repeat, **options):
+        loaders = engines['django'].engine.template_loaders
+        if not any(isinstance(loader, cached.Loader) for loader in loaders):
+            self.stderr.write(
+                'Кэширующий загрузчик шаблонов Django выключен (DEBUG), '
+                'их время будет завышено'
+            )
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        self.stdout.write(
+            f'{"шаблон":<26}{"карточки":<10}{"django, мс":>12}'
+            f'{"jinja2, мс":>12}{"ускорение":>12}'
+        )
+        for template_name, context in self.pages(request):
+            page_obj = context.get('page_obj')
+            for state in CARD_STATES if page_obj is not None else ('-',):
+                timings = [
+                    self.measure(template_name, context, request, engine,
+                                 state, repeat)
+                    for engine in ENGINES
+                ]
+                self.stdout.write(
+                    f'{template_name:<26}{state:<10}{timings[0]:>12.3f}'
+                    f'{timings[1]:>12.3f}{timings[0] / timings[1]:>11.1f}x'
+                )
+
+    def prepare_cards(self, page_obj, engine, state):
+        """Холодные карточки рисует шаблон, тёплые берутся из кэша движка."""
+        if state == 'warm':
+            prefetch_cards(page_obj, engine)
+            return
+        prefetch_thumbnails(page_obj)
+        for post in page_obj:
+            vars(post).pop('card', None)
+
+    def measure(self, template_name, context, request, engine, state,
+                repeat):
+        """Медиана времени одной отрисовки в миллисекундах."""
+        if 'page_obj' in context:
+            self.prepare_cards(context['page_obj'], engine, state)
+        render_to_string(template_name, context, request, using=engine)
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render_to_string(template_name, context, request, using=engine)
+            samples.append(time.perf_counter() - started)
+        return statistics.median(samples) * 1000
+
+    def pages(self, request):
+        """Контексты страниц, как их собирают представления."""
+        post = Post.objects.select_related(
+            'author__stats', 'group').order_by('-group', '-pub_date').first()
+        if post is None:
+            raise CommandError('В базе нет постов')
+        posts = Post.objects.select_related('author', 'group')
+        feeds = {
+            'posts/index.html': {},
+            'posts/follow.html': {},
+            'posts/profile.html': {
+                'author': post.author,
+                'post_count': get_stats(post.author).posts_count,
+            },
+        }
+        if post.group:
+            feeds['posts/group_list.html'] = {'group': post.group}
+        for template_name, context in feeds.items():
+            queryset = posts
+            if 'group' in context:
+                queryset = posts.filter(group=post.group)
+            elif 'author' in context:
+                queryset = posts.filter(author=post.author)
+            page_obj = paginate(request, queryset)
+            yield template_name, dict(context, page_obj=page_obj)
+        prefetch_thumbnails([post])
+        yield 'posts/post_detail.html', {
+            'post': post,
+            'author': post.author,
+            'post_count': get_stats(post.author).posts_count,
+            'comments': CursorPaginator(
+                post.comments.select_related('author'),
+                settings.COMMENT_COUNT
+            ).get_page(1),
+            'form': CommentForm(),
+        }
@@ -0,0 +1,321 @@
+import json
+import math
+import random
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import counters, timeline
+from posts.models import Comment, Follow, Group, Post, User
+from posts.utils import chunks, keep_dates
+
+WORDS = (
+    'кот собака дом лес река город утро вечер дождь снег письмо песня '
+    'книга дорога поезд море ветер окно чай хлеб'
+).split()
+
+PERCENTILES = (50, 95, 99)
+
+
+class Rollback(Exception):
+    """Откатить транзакцию с засеянными данными."""
+
+
+class RowCounter:
+    """Обёртка execute_wrapper, считающая строки, прочитанные из курсора."""
+
+    def __init__(self):
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        wrapper = context['cursor']
+        if not isinstance(wrapper.cursor, CountingCursor):
+            wrapper.cursor = CountingCursor(wrapper.cursor, self)
+        return execute(sql, params, many, context)
+
+
+class CountingCursor:
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def __getattr__(self, attr):
+        return getattr(self._cursor, attr)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._counter.rows += 1
+            yield row
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._counter.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._counter.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._counter.rows += len(rows)
+        return rows
+
+
+def percentile(samples, q):
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(samples)
+    index = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = ('Засевает базу и замеряет все страницы постов: задержки, '
+            'запросы, прочитанные строки и пиковую память. '
+            'Очищает настроенный кэш - не запускайте на рабочем сервере')
+
+    def add_arguments(self, parser):
+        for name, default in (('users', 200), ('groups', 20),
+                              ('posts', 5000), ('comments', 20000),
+                              ('follows', 2000)):
+            parser.add_argument(
+                f'--{name}', type=int, default=default,
+                help=f'сколько засеять ({default} по умолчанию)',
+            )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='сколько раз запрашивать каждую страницу',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='зерно генератора случайных данных',
+        )
+        parser.add_argument(
+            '--output', default='-',
+            help='файл для JSON-отчёта; «-» - stdout',
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='оставить засеянные данные в базе',
+        )
+
+    def handle(self, *args, repeat, seed, output, keep, **options):
+        if settings.DEBUG:
+            self.stderr.write(
+                'DEBUG включён: запросы журналируются, '
+                'задержки будут завышены'
+            )
+        volumes = {
+            name: options[name]
+            for name in ('users', 'groups', 'posts', 'comments', 'follows')
+        }
+        random.seed(seed)
+        try:
+            with transaction.atomic():
+                self.seed(**volumes)
+                results = self.run(repeat)
+                if not keep:
+                    raise Rollback
+        except Rollback:
+            pass
+        cache.clear()
+        report = {
+            'volumes': volumes,
+            'repeat': repeat,
+            'settings': {
+                'DEBUG': settings.DEBUG,
+                'FEED_TEMPLATE_ENGINE': settings.FEED_TEMPLATE_ENGINE,
+                'database': connection.vendor,
+            },
+            'results': results,
+        }
+        text = json.dumps(report, indent=2, sort_keys=True,
+                          ensure_ascii=False)
+        if output == '-':
+            self.stdout.write(text)
+            return
+        with open(output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+        self.summary(results)
+
+    def seed(self, users, groups, posts, comments, follows):
+        """Засеять данные пачками, досчитав то, что делают сигналы."""
+        prefix = f'bench-{int(time.time())}-'
+        User.objects.bulk_create(
+            (User(username=f'{prefix}{i}', password=make_password(None))
+             for i in range(users))
+        )
+        user_ids = list(User.objects.filter(
+            username__startswith=prefix).values_list('pk', flat=True))
+        Group.objects.bulk_create(
+            (Group(title=f'Группа {i}', slug=f'{prefix}{i}',
+                   description='')
+             for i in range(groups))
+        )
+        group_ids = list(Group.objects.filter(
+            slug__startswith=prefix).values_list('pk', flat=True))
+        if not user_ids:
+            return
+        now = timezone.now()
+        with keep_dates(Post, Comment):
+            Post.objects.bulk_create(
+                (Post(text=self.text(), author_id=random.choice(user_ids),
+                      group_id=random.choice(group_ids + [None]),
+                      pub_date=now - timedelta(minutes=i))
+                 for i in range(posts))
+            )
+            post_ids = list(Post.objects.filter(
+                author__username__startswith=prefix).values_list(
+                    'pk', flat=True))
+            if post_ids:
+                Comment.objects.bulk_create(
+                    (Comment(text=self.text(),
+                             post_id=random.choice(post_ids),
+                             author_id=random.choice(user_ids),
+                             pub_date=now - timedelta(seconds=i))
+                     for i in range(comments))
+                )
+        pairs = set()
+        limit = len(user_ids) * (len(user_ids) - 1)
+        while len(pairs) < min(follows, limit):
+            user_id, author_id = random.sample(user_ids, 2)
+            pairs.add((user_id, author_id))
+        Follow.objects.bulk_create(
+            (Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in pairs)
+        )
+        counters.reconcile()
+        for chunk in chunks(user_ids, 500):
+            timeline.rebuild(chunk)
+
+    def text(self):
+        return ' '.join(random.choices(WORDS, k=random.randint(3, 30)))
+
+    def routes(self):
+        """Все маршруты posts/urls.py с засеянными аргументами."""
+        reader = User.objects.order_by('-stats__following_count').first()
+        post = (Post.objects.filter(author=reader).order_by(
+            '-comments_count').first()
+            or Post.objects.order_by('-comments_count').first())
+        group = Group.objects.annotate(
+            total=Count('post')).order_by('-total').first()
+        author = post.author if post else reader
+        username = author.username if author else 'nobody'
+        slug = group.slug if group else 'nobody'
+        post_id = post.pk if post else 0
+        get = 'get'
+        return reader, [
+            ('main_page', get, reverse('posts:main_page'), None),
+            ('group_list', get,
+             reverse('posts:group_list', args=[slug]), None),
+            ('group_export', get,
+             reverse('posts:group_export', args=[slug]), None),
+            ('profile', get, reverse('posts:profile', args=[username]),
+             None),
+            ('profile_export', get,
+             reverse('posts:profile_export', args=[username]), None),
+            ('search', get, reverse('posts:search') + '?q=кот', None),
+            ('post_detail', get,
+             reverse('posts:post_detail', args=[post_id]), None),
+            ('post_create', get, reverse('posts:post_create'), None),
+            ('post_edit', get, reverse('posts:post_edit', args=[post_id]),
+             None),
+            ('add_comment', 'post',
+             reverse('posts:add_comment', args=[post_id]),
+             {'text': 'Комментарий из бенчмарка'}),
+            ('post_comments', get,
+             reverse('posts:post_comments', args=[post_id]), None),
+            ('follow_index', get, reverse('posts:follow_index'), None),
+            ('profile_follow', get,
+             reverse('posts:profile_follow', args=[username]), None),
+            ('profile_unfollow', get,
+             reverse('posts:profile_unfollow', args=[username]), None),
+        ]
+
+    def run(self, repeat):
+        reader, routes = self.routes()
+        clients = {'anonymous': Client()}
+        if reader is not None:
+            clients['authenticated'] = Client()
+            clients['authenticated'].force_login(reader)
+        results = {}
+        for name, method, url, data in routes:
+            route = results.setdefault(f'posts:{name}', {})
+            for audience, client in clients.items():
+                route[audience] = {
+                    state: self.measure(
+                        client, method, url, data, state == 'cold', repeat)
+                    for state in ('cold', 'warm')
+                }
+        return results
+
+    def request(self, client, method, url, data):
+        response = getattr(client, method)(url, data)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def measure(self, client, method, url, data, cold, repeat):
+        """Задержки по `repeat` запросам и один инструментированный замер.
+
+        Запросы, строки и память снимаются отдельным запросом:
+        tracemalloc замедляет код и исказил бы задержки.
+        """
+        if not cold:
+            self.request(client, method, url, data)
+        samples = []
+        for _ in range(max(repeat, 1)):
+            if cold:
+                cache.clear()
+            started = time.perf_counter()
+            self.request(client, method, url, data)
+            samples.append((time.perf_counter() - started) * 1000)
+        if cold:
+            cache.clear()
+        rows = RowCounter()
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries, \
+                    connection.execute_wrapper(rows):
+                response = self.request(client, method, url, data)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        result = {
+            f'p{q}_ms': round(percentile(samples, q), 3)
+            for q in PERCENTILES
+        }
+        result.update({
+            'status': response.status_code,
+            'queries': len(queries),
+            'rows': rows.rows,
+            'peak_memory_kb': round(peak / 1024, 1),
+        })
+        return result
+
+    def summary(self, results):
+        self.stdout.write(
+            f'{"страница":<24}{"кто":<15}{"кэш":<6}{"p50, мс":>10}'
+            f'{"p99, мс":>10}{"запросы":>9}{"строки":>9}'
+        )
+        for name, audiences in results.items():
+            for audience, states in audiences.items():
+                for state, result in states.items():
+                    self.stdout.write(
+                        f'{name:<24}{audience:<15}{state:<6}'
+                        f'{result["p50_ms"]:>10.3f}{result["p99_ms"]:>10.3f}'
+                        f'{result["queries"]:>9}{result["rows"]:>9}'
+                    )
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import CONTENT_TYPES, export_lines
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты автора или группы в JSON Lines или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--author', help='username автора')
+        parser.add_argument('--group', help='slug группы')
+        parser.add_argument(
+            '--format', choices=tuple(CONTENT_TYPES), default='jsonl',
+            dest='file_format',
+        )
+        parser.add_argument(
+            '--output', help='файл выгрузки; по умолчанию - stdout',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int,
+            help='сколько строк читать из базы за раз',
+        )
+
+    def handle(self, *args, author, group, file_format, output, chunk_size,
+               **options):
+        posts = Post.objects.all()
+        if author:
+            posts = posts.filter(author__username=author)
+        if group:
+            posts = posts.filter(group__slug=group)
+        if not (author or group):
+            raise CommandError('Укажите --author или --group')
+        lines = export_lines(posts, file_format, chunk_size)
+        if not output:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(output, 'w', encoding='utf-8', newline='') as file:
+            file.writelines(lines)
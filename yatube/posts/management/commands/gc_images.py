@@ -0,0 +1,97 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from posts.images import thumbnail_file, thumbnail_jobs
+from posts.models import Post
+from posts.utils import chunks
+
+
+def walk(storage, directory):
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = 'Удаляет картинки, на которые не ссылается ни один пост'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=60 * 60,
+            help='не трогать файлы моложе стольких секунд',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='сколько ключей kvstore удалять одним запросом',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='только показать, что будет удалено',
+        )
+
+    def handle(self, *args, grace, batch_size, dry_run, **options):
+        field = Post._meta.get_field('image')
+        storage = field.storage
+        referenced = set(
+            Post.objects.exclude(image='')
+            .values_list('image', flat=True).iterator()
+        )
+        border = timezone.now() - timedelta(seconds=grace)
+        orphans = [
+            name for name in walk(storage, field.upload_to.rstrip('/'))
+            if name not in referenced
+            and storage.get_modified_time(name) < border
+        ]
+        if not dry_run:
+            orphans = self.still_orphaned(storage, orphans, border)
+        freed = sum(storage.size(name) for name in orphans)
+        keys = []
+        thumbnails = []
+        for name in orphans:
+            source = ImageFile(name, storage)
+            keys += [add_prefix(source.key), add_prefix(source.key,
+                                                        'thumbnails')]
+            for geometry, options in thumbnail_jobs(name):
+                thumbnail = thumbnail_file(source, geometry, options)
+                keys.append(add_prefix(thumbnail.key))
+                if thumbnail.exists():
+                    thumbnails.append(thumbnail)
+        if not dry_run:
+            for name in orphans:
+                storage.delete(name)
+            for thumbnail in thumbnails:
+                thumbnail.delete()
+            for batch in chunks(keys, batch_size):
+                default.kvstore._delete_raw(*batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет удалено" if dry_run else "Удалено"} картинок: '
+            f'{len(orphans)} ({freed / 1024 / 1024:.1f} МБ), '
+            f'превью: {len(thumbnails)}'
+        ))
+
+    def still_orphaned(self, storage, names, border):
+        """Перепроверить сирот перед удалением.
+
+        Пока шёл обход, новый пост мог сослаться на старый файл:
+        одинаковая загрузка не пишет файл заново, а только обновляет
+        время его изменения.
+        """
+        referenced = set()
+        for batch in chunks(names, 500):
+            referenced.update(Post.objects.filter(
+                image__in=batch).values_list('image', flat=True))
+        return [
+            name for name in names
+            if name not in referenced
+            and storage.get_modified_time(name) < border
+        ]
@@ -0,0 +1,285 @@
+import csv
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import caching, counters, timeline
+from posts.models import Comment, Follow, Group, Post, User
+from posts.utils import chunks, keep_dates
+from posts.workers import image_metadata
+
+FORMATS = ('jsonl', 'csv')
+STRING_FIELDS = ('text', 'author', 'group', 'image', 'pub_date')
+
+
+class Command(BaseCommand):
+    help = 'Импортирует посты и комментарии из JSONL или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='файл с постами; «-» - читать из stdin',
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS, dest='file_format',
+            help='формат файла; по умолчанию - по расширению',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='сколько постов записывать одной транзакцией',
+        )
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='заводить неизвестных авторов без пароля',
+        )
+        parser.add_argument(
+            '--create-groups', action='store_true',
+            help='заводить неизвестные группы',
+        )
+        parser.add_argument(
+            '--images-root',
+            help='каталог, от которого считаются пути картинок',
+        )
+        parser.add_argument(
+            '--progress', type=float, default=5,
+            help='как часто, в секундах, печатать скорость',
+        )
+
+    def handle(self, *args, path, file_format, batch_size, create_users,
+               create_groups, images_root, progress, **options):
+        file_format = file_format or (
+            'csv' if path.lower().endswith('.csv') else 'jsonl')
+        self.create_users = create_users
+        self.create_groups = create_groups
+        self.images_root = images_root
+        self.batch_size = batch_size
+        self.storage = Post._meta.get_field('image').storage
+        self.users = {}
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.authors = set()
+        self.group_ids = set()
+        self.posts = self.comments = self.skipped = 0
+        self.first_id = None
+        started = reported = time.monotonic()
+        with self.open(path) as file, keep_dates(Post, Comment):
+            records = self.read(file, file_format)
+            for batch in chunks(records, batch_size):
+                with transaction.atomic():
+                    self.import_batch(batch)
+                if time.monotonic() - reported >= progress:
+                    reported = time.monotonic()
+                    self.stdout.write(
+                        f'Постов: {self.posts}, '
+                        f'{self.posts / (reported - started):.0f} в секунду'
+                    )
+        if self.posts:
+            self.finish()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано постов: {self.posts}, '
+            f'комментариев: {self.comments}, пропущено: {self.skipped}, '
+            f'за {elapsed:.1f} с ({self.posts / max(elapsed, 1e-6):.0f} '
+            f'постов в секунду)'
+        ))
+
+    @contextmanager
+    def open(self, path):
+        if path == '-':
+            yield sys.stdin
+            return
+        try:
+            file = open(path, encoding='utf-8', newline='')
+        except OSError as error:
+            raise CommandError(error)
+        with file:
+            yield file
+
+    def read(self, file, file_format):
+        """Проверенные записи файла по одной, без чтения файла целиком.
+
+        В CSV колонка comments - JSON-список комментариев, как в JSONL.
+        Неверная запись останавливает импорт с номером её строки.
+        """
+        if file_format == 'csv':
+            reader = csv.DictReader(file)
+            lines = ((reader.line_num, record) for record in reader)
+        else:
+            lines = (
+                (number, line) for number, line in enumerate(file, 1)
+                if line.strip()
+            )
+        for number, line in lines:
+            try:
+                if file_format == 'csv':
+                    line['comments'] = json.loads(
+                        line.get('comments') or '[]')
+                    record = self.clean(line)
+                else:
+                    record = self.clean(json.loads(line))
+            except ValueError as error:
+                raise CommandError(f'Строка {number}: {error}')
+            yield record
+
+    def clean(self, record):
+        """Проверить типы полей записи и разобрать её даты."""
+        if not isinstance(record, dict):
+            raise ValueError('запись должна быть объектом')
+        comments = record.get('comments') or []
+        if not isinstance(comments, list):
+            raise ValueError('comments должен быть списком')
+        for item in (record, *comments):
+            if not isinstance(item, dict):
+                raise ValueError('комментарий должен быть объектом')
+            for field in STRING_FIELDS:
+                if not isinstance(item.get(field) or '', str):
+                    raise ValueError(f'{field} должен быть строкой')
+            item['pub_date'] = self.parse_date(item.get('pub_date'))
+        record['comments'] = comments
+        return record
+
+    def import_batch(self, batch):
+        usernames = set()
+        for record in batch:
+            usernames.add(record.get('author'))
+            for comment in record['comments']:
+                usernames.add(comment.get('author'))
+        self.resolve_users(usernames - {None, ''} - set(self.users))
+        self.resolve_groups(
+            {record.get('group') for record in batch}
+            - {None, ''} - set(self.groups)
+        )
+        # bulk_create не возвращает id на SQLite, поэтому id выдаются
+        # заранее: по ним к постам привязываются комментарии
+        next_id = (Post.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        if self.first_id is None:
+            self.first_id = next_id
+        posts = []
+        comments = []
+        for record in batch:
+            author_id = self.users.get(record.get('author'))
+            group = record.get('group') or None
+            if author_id is None or (group and group not in self.groups):
+                self.skipped += 1
+                continue
+            post = Post(
+                id=next_id,
+                text=record.get('text') or '',
+                author_id=author_id,
+                group_id=self.groups.get(group),
+                pub_date=record['pub_date'],
+            )
+            if record.get('image') and self.images_root:
+                self.attach_image(post, record['image'])
+            next_id += 1
+            posts.append(post)
+            self.authors.add(author_id)
+            if post.group_id:
+                self.group_ids.add(post.group_id)
+            for comment in record['comments']:
+                comment_author_id = self.users.get(comment.get('author'))
+                if comment_author_id is None:
+                    continue
+                comments.append(Comment(
+                    post_id=post.id,
+                    author_id=comment_author_id,
+                    text=comment.get('text') or '',
+                    pub_date=comment['pub_date'],
+                ))
+        Post.objects.bulk_create(posts, batch_size=self.batch_size)
+        Comment.objects.bulk_create(comments, batch_size=self.batch_size)
+        self.posts += len(posts)
+        self.comments += len(comments)
+
+    def resolve_users(self, usernames):
+        if not usernames:
+            return
+        if self.create_users:
+            User.objects.bulk_create(
+                [User(username=username, password=make_password(None))
+                 for username in usernames],
+                ignore_conflicts=True,
+            )
+        self.users.update(User.objects.filter(
+            username__in=usernames).values_list('username', 'pk'))
+
+    def resolve_groups(self, slugs):
+        if not slugs or not self.create_groups:
+            return
+        Group.objects.bulk_create(
+            [Group(slug=slug, title=slug, description='') for slug in slugs],
+            ignore_conflicts=True,
+        )
+        self.groups.update(Group.objects.filter(
+            slug__in=slugs).values_list('slug', 'pk'))
+
+    def parse_date(self, value):
+        """Дата из файла; пустая - текущее время, неверная - ValueError."""
+        if not value:
+            return timezone.now()
+        date = parse_datetime(value)
+        if date is None:
+            raise ValueError(f'неверная дата {value!r}')
+        if timezone.is_naive(date):
+            return timezone.make_aware(date)
+        return date
+
+    def attach_image(self, post, path):
+        """Скопировать картинку в хранилище и записать её метаданные."""
+        try:
+            file = open(os.path.join(self.images_root, path), 'rb')
+        except OSError as error:
+            self.stderr.write(f'Картинка не найдена: {error}')
+            return
+        with file:
+            (post.image_width, post.image_height,
+             post.image_size, post.image_hash) = image_metadata(file)
+            post.image = self.storage.save(
+                Post._meta.get_field('image').upload_to
+                + os.path.basename(path),
+                File(file),
+            )
+
+    def finish(self):
+        """Досчитать то, что при обычном save() делают сигналы.
+
+        Поисковый индекс держат в порядке триггеры базы, а счётчики,
+        ленты подписчиков и поколения кэша нужно поправить вручную.
+        """
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [Post, Comment]):
+                cursor.execute(sql)
+        # id выдаются подряд от первого свободного, так что импортированные
+        # посты и их авторы находятся одним диапазоном, без списков id
+        imported = Post.objects.filter(pk__gte=self.first_id)
+        with transaction.atomic():
+            counters.reconcile(
+                users=User.objects.filter(pk__in=imported.values('author')),
+                posts=imported,
+            )
+        for authors in chunks(self.authors, 500):
+            follows = Follow.objects.filter(
+                author_id__in=authors).values_list('user_id', 'author_id')
+            for user_id, author_id in follows.iterator():
+                timeline.backfill(user_id, author_id)
+        slugs = Group.objects.filter(
+            pk__in=self.group_ids).values_list('slug', flat=True)
+        usernames = [
+            username for username, pk in self.users.items()
+            if pk in self.authors
+        ]
+        caching.bump(
+            'posts',
+            *(f'group:{slug}' for slug in slugs),
+            *(f'author:{username}' for username in usernames),
+        )
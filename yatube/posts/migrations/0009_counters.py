@@ -0,0 +1,60 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:38
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+
+    def totals(queryset, field):
+        return dict(
+            queryset.order_by().values_list(field).annotate(Count('id'))
+        )
+
+    posts = totals(Post.objects.all(), 'author_id')
+    followers = totals(Follow.objects.all(), 'author_id')
+    following = totals(Follow.objects.all(), 'user_id')
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=user_id,
+                   posts_count=posts.get(user_id, 0),
+                   followers_count=followers.get(user_id, 0),
+                   following_count=following.get(user_id, 0))
+         for user_id in User.objects.values_list('id', flat=True)),
+        batch_size=500,
+    )
+    comments = totals(Comment.objects.all(), 'post_id')
+    for post_id, total in comments.items():
+        Post.objects.filter(id=post_id).update(comments_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.IntegerField(default=0)),
+                ('followers_count', models.IntegerField(default=0)),
+                ('following_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
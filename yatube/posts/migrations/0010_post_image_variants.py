@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_variants',
+            field=models.TextField(blank=True, default='', editable=False, help_text='JSON-манифест уменьшенных копий для srcset', verbose_name='Варианты картинки'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+# SQLite добавляет колонку пересозданием таблицы, а вместе со старой
+# таблицей пропадают и её триггеры - их нужно завести заново.
+SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post BEGIN
+        INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post BEGIN
+        INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text ON posts_post
+    BEGIN
+        INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+]
+
+# updated_at меняется и при queryset.update(), который обходит auto_now
+TOUCH_TRIGGER = """
+    CREATE TRIGGER posts_post_touch
+    AFTER UPDATE OF text, group_id, image, image_variants ON posts_post
+    WHEN new.updated_at = old.updated_at
+    BEGIN
+        UPDATE posts_post
+        SET updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+        WHERE id = new.id;
+    END
+"""
+
+DROP_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS posts_post_touch',
+    'DROP TRIGGER IF EXISTS posts_post_fts_update',
+    'DROP TRIGGER IF EXISTS posts_post_fts_delete',
+    'DROP TRIGGER IF EXISTS posts_post_fts_insert',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_search'),
+    ]
+
+    operations = [
+        migrations.RunSQL(migrations.RunSQL.noop, SEARCH_TRIGGERS),
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Последнее изменение'),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(SEARCH_TRIGGERS + [TOUCH_TRIGGER], DROP_TRIGGERS),
+    ]
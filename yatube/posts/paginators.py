@@ -0,0 +1,273 @@
+import base64
+import binascii
+import hashlib
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from yatube.settings import OFFSET_PAGES, POST_COUNT
+
+COUNT_KEY = 'posts:count:{}'
+
+ELLIPSIS = '…'
+
+PageLink = namedtuple('PageLink', ['number', 'query'])
+
+
+def cached_count(queryset, timeout=None):
+    """COUNT(*) запроса из кэша; в кэше он живёт `timeout` секунд."""
+    if timeout is None:
+        timeout = settings.COUNT_CACHE_TIMEOUT
+    sql, params = queryset.query.sql_with_params()
+    key = COUNT_KEY.format(
+        hashlib.md5(f'{sql}|{params}'.encode()).hexdigest())
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+def elided_links(page, first_pages=1, last_page=None):
+    """Короткий ряд ссылок на страницы вокруг текущей.
+
+    В ряд попадают только страницы, до которых можно дойти без OFFSET:
+    первые `first_pages` по `?page=N`, соседние по курсорам и последняя
+    по `?page=last`, если паджинатор знает число страниц. Пропуски
+    между ними заменяются многоточием. У текущей страницы и многоточия
+    `query` пустой.
+    """
+    number = page.number
+    last_known = max(page.paginator.num_pages, last_page or 0)
+    links = {
+        index: f'page={index}'
+        for index in range(1, min(first_pages, last_known) + 1)
+    }
+    if page.previous_cursor:
+        links.setdefault(number - 1, f'cursor={page.previous_cursor}')
+    if page.next_cursor:
+        links.setdefault(number + 1, f'cursor={page.next_cursor}')
+    if last_page and last_page > number:
+        links.setdefault(last_page, 'page=last')
+    links[number] = None
+    result = []
+    previous = 0
+    for index in sorted(links):
+        if index - previous > 1:
+            result.append(PageLink(ELLIPSIS, None))
+        result.append(PageLink(index, links[index]))
+        previous = index
+    return result
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (pub_date, id).
+
+    Следующая и предыдущая страницы выбираются по непрозрачному курсору
+    `?cursor=` без OFFSET и без COUNT(*): запрос читает только
+    `per_page + 1` строк, лишняя строка показывает, есть ли продолжение.
+    Старые ссылки `?page=N` работают для первых `offset_pages` страниц.
+    """
+
+    # сколько первых страниц показывать в ряду ссылок
+    on_ends = 2
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id'),
+                 offset_pages=OFFSET_PAGES):
+        self.keys = tuple(keys)
+        self.offset_pages = offset_pages
+        self._num_pages = 1
+        super().__init__(
+            object_list.order_by(*('-' + key for key in self.keys)),
+            per_page
+        )
+
+    @property
+    def num_pages(self):
+        """Номер последней известной страницы, без подсчёта всех строк."""
+        return self._num_pages
+
+    def get_page(self, number, cursor=None):
+        if cursor:
+            state = self.decode_cursor(cursor)
+            if state is not None:
+                return self._keyset_page(*state)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            number = 1
+        if not 1 <= number <= self.offset_pages:
+            number = 1
+        return self._offset_page(number)
+
+    def page(self, number):
+        return self.get_page(number)
+
+    def encode_cursor(self, obj, number, backwards=False):
+        values = [getattr(obj, key) for key in self.keys]
+        state = {
+            'k': [value.isoformat() if hasattr(value, 'isoformat') else value
+                  for value in values],
+            'n': number,
+            'b': backwards,
+        }
+        raw = json.dumps(state, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Разобрать курсор; для испорченного вернуть None."""
+        padding = '=' * (-len(cursor) % 4)
+        try:
+            state = json.loads(base64.urlsafe_b64decode(cursor + padding))
+            values = [
+                self.object_list.model._meta.get_field(key).to_python(value)
+                for key, value in zip(self.keys, state['k'])
+            ]
+            number = int(state['n'])
+            backwards = bool(state['b'])
+        except (binascii.Error, ValueError, TypeError, KeyError,
+                ValidationError):
+            return None
+        if len(values) != len(self.keys) or None in values or number < 1:
+            return None
+        return values, number, backwards
+
+    def _keyset_filter(self, values, lookup):
+        condition = Q()
+        for index, key in enumerate(self.keys):
+            step = Q(**{f'{key}__{lookup}': values[index]})
+            for equal_key, equal_value in zip(self.keys, values[:index]):
+                step &= Q(**{equal_key: equal_value})
+            condition |= step
+        return condition
+
+    def _offset_page(self, number):
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            return self._offset_page(1)
+        return self._build_page(rows, number)
+
+    def _keyset_page(self, values, number, backwards):
+        if not backwards:
+            rows = list(
+                self.object_list.filter(self._keyset_filter(values, 'lt'))
+                [:self.per_page + 1]
+            )
+            if not rows:
+                return self._offset_page(1)
+            return self._build_page(rows, number)
+        rows = list(
+            self.object_list
+            .filter(self._keyset_filter(values, 'gt'))
+            .order_by(*self.keys)[:self.per_page + 1]
+        )
+        if len(rows) <= self.per_page or number <= 1:
+            return self._offset_page(1)
+        rows = rows[:self.per_page][::-1]
+        return self._build_page(rows, number, has_next=True)
+
+    def _build_page(self, rows, number, has_next=None):
+        if has_next is None:
+            has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        self._num_pages = number + 1 if has_next else number
+        page = Page(rows, number, self)
+        page.next_cursor = None
+        page.previous_cursor = None
+        if has_next:
+            page.next_cursor = self.encode_cursor(rows[-1], number + 1)
+        if number > 1 and rows:
+            page.previous_cursor = self.encode_cursor(
+                rows[0], number - 1, backwards=True
+            )
+        page.links = self.page_links(page)
+        return page
+
+    def page_links(self, page):
+        return elided_links(page, min(self.on_ends, self.offset_pages))
+
+
+class CountedCursorPaginator(CursorPaginator):
+    """Курсорный паджинатор, который знает число страниц.
+
+    Число строк берётся из денормализованного счётчика, если он передан
+    в `count` (числом или функцией), иначе - из COUNT(*), который
+    `timeout` секунд хранится в кэше. Счётчик может немного отставать
+    от таблицы, поэтому номер последней страницы `last_number`
+    приблизительный и в `num_pages` не попадает - продолжение страницы
+    по-прежнему определяет лишняя строка. Зато ряд ссылок и переход
+    `?page=last` не стоят COUNT(*) на каждый запрос.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id'),
+                 offset_pages=OFFSET_PAGES, count=None, timeout=None):
+        self.count_source = count
+        self.timeout = timeout
+        super().__init__(object_list, per_page, keys, offset_pages)
+
+    @cached_property
+    def count(self):
+        if callable(self.count_source):
+            return self.count_source()
+        if self.count_source is not None:
+            return self.count_source
+        return cached_count(self.object_list, self.timeout)
+
+    @property
+    def last_number(self):
+        return max(-(-self.count // self.per_page), 1)
+
+    def get_page(self, number, cursor=None):
+        if number == 'last' and not cursor:
+            return self._last_page()
+        return super().get_page(number, cursor)
+
+    def page_links(self, page):
+        return elided_links(
+            page, min(self.on_ends, self.offset_pages), self.last_number)
+
+    def _last_page(self):
+        """Хвост ленты: обратный порядок по ключам, без OFFSET."""
+        number = self.last_number
+        size = self.count - (number - 1) * self.per_page
+        size = min(max(size, 1), self.per_page)
+        rows = list(self.object_list.order_by(*self.keys)[:size])[::-1]
+        if number <= 1 or not rows:
+            return self._offset_page(1)
+        return self._build_page(rows, number, has_next=False)
+
+
+class CachedCountPaginator(Paginator):
+    """Обычный паджинатор, но COUNT(*) запроса хранится в кэше.
+
+    Число строк живёт COUNT_CACHE_TIMEOUT секунд и между делом может
+    отставать от таблицы - для админки с миллионами строк это лучше,
+    чем полный подсчёт на каждое открытие страницы.
+    """
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        return cached_count(self.object_list)
+
+
+def paginate(request, queryset, keys=('pub_date', 'id'), per_page=POST_COUNT,
+             count=None):
+    """Страница ленты для запроса: по `?cursor=` или по `?page=`.
+
+    `count` - денормализованный счётчик строк, без него число строк
+    считается COUNT(*) и кэшируется.
+    """
+    paginator = CountedCursorPaginator(queryset, per_page, keys, count=count)
+    return paginator.get_page(
+        request.GET.get('page'),
+        request.GET.get('cursor')
+    )
@@ -0,0 +1,106 @@
+import base64
+import binascii
+import json
+import re
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+from .paginators import elided_links
+
+MAX_TERMS = 10
+MATCH_IDS = 'SELECT rowid FROM posts_post_fts WHERE posts_post_fts MATCH %s'
+
+
+def match_expression(query):
+    """Запрос пользователя как выражение FTS5 MATCH.
+
+    Берутся только слова, так что синтаксис FTS5 из запроса не
+    просачивается; все слова обязательны, последнее ищется по префиксу.
+    """
+    words = re.findall(r'\w+', query or '')[:MAX_TERMS]
+    if not words:
+        return ''
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def filter_posts(queryset, query):
+    """Оставить в queryset посты, подходящие под запрос, через индекс."""
+    match = match_expression(query)
+    if not match:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(MATCH_IDS, [match]))
+
+
+class SearchPaginator(Paginator):
+    """Выдача поиска по курсору (rank, id) без COUNT(*)."""
+
+    def __init__(self, per_page):
+        super().__init__([], per_page)
+        self._num_pages = 1
+
+    @property
+    def num_pages(self):
+        return self._num_pages
+
+    def encode_cursor(self, rank, post_id, number):
+        raw = json.dumps([rank, post_id, number]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        padding = '=' * (-len(cursor) % 4)
+        try:
+            rank, post_id, number = json.loads(
+                base64.urlsafe_b64decode(cursor + padding))
+            return float(rank), int(post_id), max(int(number), 2)
+        except (binascii.Error, ValueError, TypeError):
+            return None
+
+    def search(self, query, cursor=None):
+        state = self.decode_cursor(cursor) if cursor else None
+        number = state[2] if state else 1
+        match = match_expression(query)
+        rows = self._ranked_ids(match, state) if match else []
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        posts = Post.objects.select_related('author', 'group').in_bulk(
+            [post_id for _, post_id in rows])
+        page = Page(
+            [posts[post_id] for _, post_id in rows if post_id in posts],
+            number,
+            self
+        )
+        self._num_pages = number + 1 if has_next else number
+        page.previous_cursor = None
+        page.next_cursor = None
+        if has_next:
+            page.next_cursor = self.encode_cursor(*rows[-1], number + 1)
+        page.links = elided_links(page)
+        return page
+
+    def _ranked_ids(self, match, state):
+        sql = (
+            'SELECT rank, rowid FROM posts_post_fts '
+            'WHERE posts_post_fts MATCH %s'
+        )
+        params = [match]
+        if state:
+            rank, post_id, _ = state
+            sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+            params += [rank, rank, post_id]
+        sql += ' ORDER BY rank, rowid LIMIT %s'
+        params.append(self.per_page + 1)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+def search_page(request):
+    """Страница выдачи поиска для `?q=` и `?cursor=`."""
+    return SearchPaginator(settings.POST_COUNT).search(
+        request.GET.get('q', ''),
+        request.GET.get('cursor')
+    )
@@ -0,0 +1,121 @@
+from contextvars import ContextVar
+
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import caching, counters, timeline
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .workers import image_metadata
+
+# Посты и авторы, которые удаляются прямо сейчас. Каскадно удаляемым
+# вместе с ними строкам незачем по одной править счётчики и сбрасывать
+# кэш: родитель сбросит свои ленты один раз.
+_deleting_posts = ContextVar('deleting_posts', default=frozenset())
+_deleting_authors = ContextVar('deleting_authors', default=frozenset())
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+
+
+@receiver(pre_save, sender=Post)
+def post_image_changed(sender, instance, raw=False, **kwargs):
+    """Размеры и хэш считаются только для только что загруженного файла."""
+    if raw:
+        return
+    image = instance.image
+    if not image:
+        instance.image_width = instance.image_height = None
+        instance.image_size = None
+        instance.image_hash = ''
+    elif not image._committed:
+        (instance.image_width, instance.image_height,
+         instance.image_size, instance.image_hash) = image_metadata(
+            image.file)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.change_user_counter(instance.author_id, 'posts_count', 1)
+        timeline.fan_out(instance)
+    caching.bump_post(instance, [instance._loaded_group_id])
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    _deleting_authors.set(_deleting_authors.get() | {instance.pk})
+    slugs = Group.objects.filter(post__author=instance).values_list(
+        'slug', flat=True).distinct()
+    instance._feed_scopes = ['posts', f'author:{instance.username}',
+                             *(f'group:{slug}' for slug in slugs)]
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    _deleting_authors.set(_deleting_authors.get() - {instance.pk})
+    caching.bump(*getattr(instance, '_feed_scopes', ()))
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    _deleting_posts.set(_deleting_posts.get() | {instance.pk})
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    _deleting_posts.set(_deleting_posts.get() - {instance.pk})
+    if instance.author_id in _deleting_authors.get():
+        return
+    counters.change_user_counter(instance.author_id, 'posts_count', -1)
+    caching.bump_post(instance, [instance._loaded_group_id])
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.bump('posts', f'group:{instance.slug}')
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_comments_count(instance.post_id, 1)
+        caching.bump(f'post:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in _deleting_posts.get():
+        return
+    counters.change_comments_count(instance.post_id, -1)
+    caching.bump(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_user_counter(instance.user_id, 'following_count', 1)
+        counters.change_user_counter(instance.author_id, 'followers_count', 1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        caching.bump(f'user:{instance.user_id}')
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change_user_counter(instance.user_id, 'following_count', -1)
+    counters.change_user_counter(instance.author_id, 'followers_count', -1)
+    timeline.prune(instance.user_id, instance.author_id)
+    caching.bump(f'user:{instance.user_id}')
@@ -0,0 +1,14 @@
+from django import template
+
+from posts.cards import render_card
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_card(post):
+    """Карточка поста в ленте: из `prefetch_cards` или отрисованная сразу."""
+    card = getattr(post, 'card', None)
+    if card is None:
+        card = render_card(post)
+    return card
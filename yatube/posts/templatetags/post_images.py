@@ -0,0 +1,64 @@
+import json
+
+from django import template
+from django.conf import settings
+from sorl.thumbnail import default, get_thumbnail
+
+from posts.caching import skip_page_cache
+from posts.images import is_pending, remember_source_size
+
+register = template.Library()
+
+
+def _srcset(variants):
+    return ', '.join(
+        f'{default.storage.url(name)} {width}w' for width, name in variants
+    )
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(post, preset='card'):
+    """Превью картинки поста или заглушка, пока превью готовится.
+
+    Если у поста есть манифест вариантов, выводится `<picture>` со
+    srcset без обращения к файлам и kvstore. Иначе берутся метаданные,
+    собранные `prefetch_thumbnails` для всей страницы, а kvstore sorl
+    тег опрашивает сам только без них.
+    """
+    geometry, options = settings.THUMBNAIL_PRESETS[preset]
+    width, height = geometry.split('x')
+    context = {
+        'width': width,
+        'height': height,
+        'sizes': settings.IMAGE_SIZES,
+        'image': None,
+    }
+    if not post.image:
+        return context
+    prefetched = getattr(post, 'thumbnails', {}).get(preset)
+    if prefetched is None:
+        pending, image = is_pending(post.image), None
+    else:
+        pending, image = prefetched
+    context['pending'] = pending
+    if pending:
+        skip_page_cache()
+        return context
+    if post.image_variants and preset == settings.IMAGE_VARIANT_PRESET:
+        manifest = list(json.loads(post.image_variants).items())
+        *sources, (_, fallback) = manifest
+        context['sources'] = [
+            (mime, _srcset(variants)) for mime, variants in sources
+        ]
+        context['srcset'] = _srcset(fallback)
+        context['src'] = default.storage.url(min(
+            fallback, key=lambda variant: abs(variant[0] - int(width))
+        )[1])
+        return context
+    if image is None:
+        remember_source_size(post)
+        image = get_thumbnail(post.image, geometry, **options)
+    context['image'] = image
+    if image.size:
+        context['width'], context['height'] = image.size
+    return context
@@ -0,0 +1,88 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..caching import get_generations
+from ..models import Group, Post
+
+User = get_user_model()
+
+
+class PostAdminTest(TestCase):
+    """Список постов в админке не дорожает с числом строк"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.author = User.objects.create_user(username='writer')
+        cls.groups = [
+            Group.objects.create(title=f'Группа {number}',
+                                 slug=f'group-{number}', description='')
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+        self.url = reverse('admin:posts_post_changelist')
+
+    def create_posts(self, count):
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=self.author,
+                 group=self.groups[number % 3])
+            for number in range(count)
+        )
+
+    def changelist_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in context.captured_queries]
+
+    def test_queries_do_not_grow_with_rows(self):
+        self.create_posts(2)
+        few = self.changelist_queries()
+        self.create_posts(20)
+        many = self.changelist_queries()
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(
+            len([sql for sql in many if 'FROM "posts_group"' in sql]), 1)
+
+    def test_count_is_cached(self):
+        self.create_posts(3)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'COUNT(' in query['sql'] and 'posts_post' in query['sql']
+        ])
+
+    def test_move_to_group(self):
+        self.create_posts(4)
+        ids = list(Post.objects.filter(
+            group=self.groups[0]).values_list('pk', flat=True))
+        target = self.groups[2]
+        scopes = ['posts', 'group:group-0', 'group:group-2', 'author:writer']
+        before = get_generations(scopes)
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(self.url, {
+                'action': 'move_to_group',
+                'index': 0,
+                '_selected_action': ids,
+                'group': target.pk,
+            })
+        self.assertEqual(len([
+            query for query in context.captured_queries
+            if query['sql'].startswith('UPDATE "posts_post"')
+        ]), 1)
+        self.assertEqual(
+            Post.objects.filter(pk__in=ids, group=target).count(), len(ids))
+        for scope, old, new in zip(scopes, before, get_generations(scopes)):
+            with self.subTest(scope=scope):
+                self.assertNotEqual(old, new)
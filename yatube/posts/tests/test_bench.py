@@ -0,0 +1,43 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import Post, User
+
+
+class BenchViewsTest(TestCase):
+    """Замер страниц постов на засеянной базе"""
+    def test_report_covers_every_route(self):
+        out = StringIO()
+        call_command(
+            'bench_views', users=5, groups=2, posts=30, comments=40,
+            follows=8, repeat=2, stdout=out, stderr=StringIO()
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['volumes']['posts'], 30)
+        self.assertEqual(len(report['results']), 14)
+        result = report['results']['posts:main_page']['authenticated']
+        for state in ('cold', 'warm'):
+            with self.subTest(state=state):
+                self.assertEqual(result[state]['status'], 200)
+                self.assertLessEqual(
+                    result[state]['p50_ms'], result[state]['p99_ms'])
+                self.assertGreater(result[state]['peak_memory_kb'], 0)
+        cold = report['results']['posts:group_list']['anonymous']['cold']
+        self.assertGreater(cold['queries'], 0)
+        self.assertGreater(cold['rows'], 0)
+        self.assertEqual(
+            report['results']['posts:follow_index']['anonymous']['cold'][
+                'status'], 302)
+
+    def test_seeded_data_is_rolled_back(self):
+        posts = Post.objects.count()
+        call_command(
+            'bench_views', users=3, posts=5, comments=5, follows=2,
+            repeat=1, stdout=StringIO(), stderr=StringIO()
+        )
+        self.assertFalse(User.objects.filter(
+            username__startswith='bench-').exists())
+        self.assertEqual(Post.objects.count(), posts)
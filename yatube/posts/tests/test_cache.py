@@ -1,9 +1,23 @@
-from django.core.cache import cache
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import cache, caches
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from ..models import Post
+from core.cache import TieredCache
+
+from ..caching import (GENERATION_KEY, LOCK_KEY, MODIFIED_KEY, _acquire,
+                       _refresh_later, get_generations, page_key, scope_key)
+from ..models import Comment, Follow, Group, Post
 
 User = get_user_model()
 
@@ -21,3 +35,374 @@ class TestCache(TestCase):
         self.assertEqual(len(response.context['page_obj']), 0)
         cache.clear()
         self.assertEqual(len(response.context['page_obj']), 0)
+
+
+class TestFeedCache(TestCase):
+    """Проверка кэша лент по поколениям"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='cached')
+        cls.group = Group.objects.create(
+            title='title', slug='cached', description='description')
+        cls.other_group = Group.objects.create(
+            title='other', slug='other-cached', description='description')
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_page_served_from_cache(self):
+        """Повторный запрос страницы не ходит в базу"""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+
+    def test_new_post_is_visible_at_once(self):
+        """Новый пост сразу виден в общей ленте, группе и профиле"""
+        urls = (
+            reverse('posts:main_page'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        )
+        for url in urls:
+            self.client.get(url)
+        Post.objects.create(text='fresh post', author=self.user,
+                            group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(len(response.context['page_obj']), 1)
+
+    def test_write_bumps_only_affected_scopes(self):
+        """Запись поста не сбрасывает ленты чужих групп"""
+        other = get_generations([f'group:{self.other_group.slug}'])
+        mine = get_generations([f'group:{self.group.slug}'])
+        post = Post.objects.create(text='text', author=self.user,
+                                   group=self.group)
+        self.assertEqual(
+            get_generations([f'group:{self.other_group.slug}']), other)
+        self.assertNotEqual(
+            get_generations([f'group:{self.group.slug}']), mine)
+        post.group = self.other_group
+        post.save()
+        self.assertNotEqual(
+            get_generations([f'group:{self.other_group.slug}']), other)
+
+
+class TestHolePunching(TestCase):
+    """Проверка общей страницы с персональными фрагментами"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='holes-author')
+        cls.reader = User.objects.create_user(username='holes-reader')
+        Post.objects.create(text='text', author=cls.author)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_logged_in_user_hits_anonymous_page(self):
+        """Авторизованный получает страницу из общего кэша"""
+        url = reverse('posts:profile',
+                      kwargs={'username': self.author.username})
+        anonymous = self.client.get(url).content.decode()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reader_client.get(url)
+        content = response.content.decode()
+        self.assertFalse(
+            any('posts_post' in query['sql'] for query in queries)
+        )
+        self.assertIn('Войти', anonymous)
+        self.assertNotIn('Войти', content)
+        self.assertIn(f'Пользователь: {self.reader.username}', content)
+
+    def test_follow_button_is_personal(self):
+        """Кнопка подписки своя у каждого пользователя"""
+        url = reverse('posts:profile',
+                      kwargs={'username': self.author.username})
+        self.assertIn('Подписаться', self.client.get(url).content.decode())
+        self.assertIn(
+            'Отписаться', self.reader_client.get(url).content.decode()
+        )
+
+
+class TestConditionalGet(TestCase):
+    """Проверка ответов 304 по ETag и Last-Modified"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='etag-author')
+        cls.reader = User.objects.create_user(username='etag-reader')
+        cls.post = Post.objects.create(text='text', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def tearDown(self):
+        cache.clear()
+
+    def revalidate(self, client, url, response):
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unknown_scopes_expire(self):
+        """Запросы к несуществующим группам не оставляют вечных ключей"""
+        for url in (reverse('posts:group_list', args=['nope']),
+                    reverse('posts:profile', args=['nobody'])):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        keys = [scope_key(template, scope)
+                for template in (GENERATION_KEY, MODIFIED_KEY)
+                for scope in ('group:nope', 'author:nobody')]
+        self.assertEqual(len(cache.get_many(keys)), len(keys))
+        for key in keys:
+            self.assertNotIn('nobody', key)
+            self.assertNotIn('nope', key)
+        later = time.time() + settings.FEED_GENERATION_TIMEOUT + 1
+        with patch('time.time', return_value=later):
+            self.assertEqual(cache.get_many(keys), {})
+
+    def test_unchanged_page_is_not_rendered(self):
+        """Неизменённая страница отдаётся как 304 без запросов к базе"""
+        url = reverse('posts:main_page')
+        response = self.client.get(url)
+        self.assertIn('no-cache', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            cached = self.revalidate(self.client, url, response)
+        self.assertEqual(cached.status_code, 304)
+        cached = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(cached.status_code, 304)
+        Post.objects.create(text='new', author=self.author)
+        self.assertEqual(
+            self.revalidate(self.client, url, response).status_code, 200)
+
+    def test_etag_is_personal(self):
+        """У гостя и пользователя разные ETag одной страницы"""
+        url = reverse('posts:main_page')
+        response = self.client.get(url)
+        self.assertEqual(
+            self.revalidate(self.reader_client, url, response).status_code,
+            200
+        )
+
+    def test_comment_changes_post_detail(self):
+        """Новый комментарий меняет ETag страницы поста"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        response = self.client.get(url)
+        self.assertEqual(
+            self.revalidate(self.client, url, response).status_code, 304)
+        Comment.objects.create(post=self.post, author=self.reader, text='hi')
+        self.assertEqual(
+            self.revalidate(self.client, url, response).status_code, 200)
+
+    def test_follow_changes_profile_and_timeline(self):
+        """Подписка и посты избранных авторов меняют ETag"""
+        profile = reverse('posts:profile',
+                          kwargs={'username': self.author.username})
+        timeline = reverse('posts:follow_index')
+        before = self.reader_client.get(profile)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(
+            self.revalidate(self.reader_client, profile, before).status_code,
+            200
+        )
+        response = self.reader_client.get(timeline)
+        self.assertEqual(
+            self.revalidate(self.reader_client, timeline,
+                            response).status_code,
+            304
+        )
+        Post.objects.create(text='new', author=self.author)
+        self.assertEqual(
+            self.revalidate(self.reader_client, timeline,
+                            response).status_code,
+            200
+        )
+
+
+@override_settings(FEED_CACHE_BACKGROUND=False)
+class TestStampedeProtection(TestCase):
+    """Проверка защиты от одновременного пересчёта страницы"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='stampede')
+        cls.post = Post.objects.create(text='old text', author=cls.user)
+        cls.url = reverse('posts:main_page')
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def key(self):
+        return page_key(RequestFactory().get(self.url),
+                        get_generations(['posts']))
+
+    @override_settings(FEED_CACHE_TIMEOUT=0)
+    def test_stale_page_served_while_refreshing(self):
+        """Устаревшая копия отдаётся, пока строится новая"""
+        self.client.get(self.url)
+        Post.objects.filter(pk=self.post.pk).update(text='new text')
+        stale = self.client.get(self.url).content.decode()
+        fresh = self.client.get(self.url).content.decode()
+        self.assertIn('old text', stale)
+        self.assertIn('new text', fresh)
+
+    def test_waiting_request_gets_owner_result(self):
+        """Пока страницу считает другой запрос, остальные ждут его"""
+        key = self.key()
+        cache.add(LOCK_KEY.format(key), True)
+
+        def owner_finishes(seconds):
+            cache.set(key, (b'from owner', time.time() + 60))
+
+        with patch('posts.caching.time.sleep', side_effect=owner_finishes):
+            with self.assertNumQueries(0):
+                response = self.client.get(self.url)
+        self.assertEqual(response.content, b'from owner')
+
+    @override_settings(FEED_CACHE_BACKGROUND=True)
+    def test_background_refresh_is_seen_by_other_threads(self):
+        """Поток обновления кладёт страницу и снимает блокировку для всех"""
+        key = self.key()
+        self.assertTrue(_acquire(key))
+        _refresh_later(lambda request: HttpResponse(b'fresh'),
+                       RequestFactory().get(self.url), (), {}, key)
+        deadline = time.monotonic() + 5
+        while (cache.get(LOCK_KEY.format(key)) is not None
+               and time.monotonic() < deadline):
+            time.sleep(0.01)
+        self.assertIsNone(cache.get(LOCK_KEY.format(key)))
+        self.assertEqual(cache.get(key)[0], b'fresh')
+
+    @override_settings(FEED_CACHE_TIMEOUT=1000, FEED_CACHE_JITTER=0.1)
+    def test_expiry_is_jittered(self):
+        """Срок свежести случайно растянут"""
+        self.client.get(self.url)
+        fresh_until = cache.get(self.key())[1] - time.time()
+        self.assertTrue(890 <= fresh_until <= 1100)
+
+
+class TestTieredCache(TestCase):
+    """Проверка двухуровневого кэша"""
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.directory.name, 'cache.sqlite3')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_cache(self, **options):
+        return TieredCache(self.location, {'OPTIONS': options})
+
+    def other_process(self, **options):
+        """Кэш с собственным первым уровнем, как в другом процессе."""
+        with patch.dict('core.cache._local_states', clear=True):
+            return self.make_cache(**options)
+
+    def test_shared_tier_between_processes(self):
+        first, second = self.make_cache(), self.other_process()
+        first.set('key', {'value': 1})
+        self.assertEqual(second.get('key'), {'value': 1})
+        self.assertEqual(second.stats()['shared_hits'], 1)
+        self.assertEqual(second.get('key'), {'value': 1})
+        self.assertEqual(second.stats()['local_hits'], 1)
+        first.delete('key')
+        self.assertIsNone(self.other_process().get('key'))
+
+    def test_add_and_incr_are_atomic_in_shared_tier(self):
+        first, second = self.make_cache(), self.other_process()
+        self.assertTrue(first.add('counter', 1))
+        self.assertFalse(second.add('counter', 5))
+        self.assertEqual(second.incr('counter'), 2)
+        self.assertEqual(first.incr('counter'), 3)
+        self.assertEqual(self.other_process().get('counter'), 3)
+
+    def test_local_tier_is_bounded_by_bytes(self):
+        with patch.dict('core.cache._local_states', clear=True):
+            local = TieredCache('', {'OPTIONS': {
+                'MAX_BYTES': 1000, 'COMPRESS_MIN_LENGTH': 10 ** 6}})
+        for number in range(10):
+            local.set(f'key{number}', 'x' * 200)
+        stats = local.stats()
+        self.assertLessEqual(stats['local_bytes'], 1000)
+        self.assertGreater(stats['local_evictions'], 0)
+        self.assertIsNone(local.get('key0'))
+        self.assertEqual(local.get('key9'), 'x' * 200)
+
+    def test_large_values_are_compressed(self):
+        shared = self.make_cache(COMPRESS_MIN_LENGTH=100)
+        shared.set('page', b'<div></div>' * 1000)
+        self.assertEqual(shared.stats()['compressed'], 1)
+        self.assertLess(shared.stats()['local_bytes'], 1000)
+        self.assertEqual(
+            self.other_process().get('page'), b'<div></div>' * 1000)
+
+    def test_expired_entries_are_misses(self):
+        shared = self.make_cache()
+        shared.set('short', 1, timeout=-1)
+        self.assertIsNone(shared.get('short'))
+        self.assertIsNone(self.other_process().get('short'))
+
+    def test_clear_empties_both_tiers(self):
+        first, second = self.make_cache(), self.other_process()
+        first.set('key', 1)
+        second.get('key')
+        first.clear()
+        self.assertEqual(first.stats()['local_entries'], 0)
+        self.assertIsNone(self.other_process().get('key'))
+
+    def test_local_tier_is_shared_between_threads(self):
+        """Django даёт каждому потоку свой экземпляр бэкенда"""
+        for location in ('', self.location):
+            with self.subTest(location=location), \
+                    patch.dict('core.cache._local_states', clear=True):
+                TieredCache(location, {}).set('key', 'value')
+                found = []
+                thread = threading.Thread(target=lambda: found.append(
+                    TieredCache(location, {}).get('key')))
+                thread.start()
+                thread.join()
+                self.assertEqual(found, ['value'])
+
+    def test_default_cache_is_shared_between_threads(self):
+        cache.set('threaded', 'value')
+        self.addCleanup(cache.delete, 'threaded')
+        found = []
+        thread = threading.Thread(
+            target=lambda: found.append(cache.get('threaded')))
+        thread.start()
+        thread.join()
+        self.assertEqual(found, ['value'])
+
+    def test_tests_do_not_share_the_configured_cache_file(self):
+        configured = os.environ.get(
+            'CACHE_LOCATION', os.path.join(settings.BASE_DIR, 'cache.sqlite3'))
+        location = caches['default']._path
+        self.assertNotEqual(location, configured)
+        self.assertTrue(location.startswith(tempfile.gettempdir()))
+
+    def test_stats_view_is_staff_only(self):
+        url = reverse('cache_stats')
+        user = User.objects.create_user(username='plain')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        user.is_staff = True
+        user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('local_hits', response.json())
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..cards import card_key, prefetch_cards, template_version
+from ..models import Post, User
+
+
+class PostCardTest(TestCase):
+    """Карточки постов в лентах берутся из кэша одним запросом"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='carded')
+        for number in range(3):
+            Post.objects.create(text=f'card {number}', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def posts(self):
+        return list(Post.objects.filter(author=self.author)
+                    .select_related('author', 'group'))
+
+    def test_cards_are_fetched_with_one_get_many(self):
+        prefetch_cards(self.posts())
+        posts = self.posts()
+        with patch('posts.cards.render_to_string') as render, \
+                patch.object(cache, 'get_many',
+                             wraps=cache.get_many) as get_many:
+            prefetch_cards(posts)
+        render.assert_not_called()
+        get_many.assert_called_once()
+        self.assertIn('card 0', posts[-1].card)
+
+    def test_update_gives_new_key(self):
+        post = self.posts()[0]
+        key = card_key(post)
+        Post.objects.filter(pk=post.pk).update(text='edited')
+        post = Post.objects.get(pk=post.pk)
+        self.assertNotEqual(card_key(post), key)
+        prefetch_cards([post])
+        self.assertIn('edited', post.card)
+
+    def test_feed_renders_cards(self):
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'carded'}))
+        for number in range(3):
+            self.assertContains(response, f'card {number}')
+
+    def test_nested_template_edit_gives_new_key(self):
+        post = self.posts()[0]
+        key = card_key(post)
+        templates = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, templates)
+        os.makedirs(os.path.join(templates, 'posts', 'includes'))
+        path = os.path.join(templates, 'posts', 'includes',
+                            'post_image.html')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('<img class="edited">')
+        engine = {**settings.TEMPLATES[0],
+                  'DIRS': [templates, *settings.TEMPLATES[0]['DIRS']]}
+        template_version.cache_clear()
+        self.addCleanup(template_version.cache_clear)
+        with override_settings(TEMPLATES=[engine, *settings.TEMPLATES[1:]]):
+            self.assertNotEqual(card_key(post), key)
@@ -0,0 +1,126 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Post, User, UserStats
+
+
+class CountersTest(TestCase):
+    """Проверка хранимых счётчиков"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='counted')
+        cls.reader = User.objects.create_user(username='counter')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_post_counter(self):
+        """Создание и удаление поста меняют счётчик автора"""
+        post = Post.objects.create(text='text', author=self.user)
+        self.assertEqual(self.stats(self.user).posts_count, 1)
+        post.delete()
+        self.assertEqual(self.stats(self.user).posts_count, 0)
+
+    def test_comment_counter(self):
+        """Комментарии учитываются в счётчике поста"""
+        post = Post.objects.create(text='text', author=self.user)
+        comment = Comment.objects.create(
+            text='comment', author=self.reader, post=post)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+    def test_follow_counters(self):
+        """Подписка меняет счётчики обеих сторон"""
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        self.assertEqual(self.stats(self.user).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.stats(self.user).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_user_with_posts_and_follows_can_be_deleted(self):
+        """Каскадное удаление пользователя не заводит ему новые счётчики"""
+        author = User.objects.create_user(username='leaving')
+        post = Post.objects.create(text='text', author=author)
+        Comment.objects.create(text='comment', author=self.reader, post=post)
+        Comment.objects.create(
+            text='own', author=author,
+            post=Post.objects.create(text='other', author=self.user))
+        Follow.objects.create(user=author, author=self.user)
+        Follow.objects.create(user=self.reader, author=author)
+        author_id = author.pk
+        author.delete()
+        connection.check_constraints()
+        self.assertFalse(UserStats.objects.filter(user_id=author_id).exists())
+        self.assertEqual(self.stats(self.user).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def delete_queries(self, instance):
+        with CaptureQueriesContext(connection) as queries, \
+                patch('posts.caching.bump') as bump:
+            instance.delete()
+        return len(queries), bump
+
+    def test_post_delete_does_not_touch_each_comment(self):
+        """Удаление поста не правит счётчик и кэш на каждый комментарий"""
+        counts = []
+        for total in (2, 20):
+            post = Post.objects.create(text='text', author=self.user)
+            Comment.objects.bulk_create(
+                Comment(text='comment', author=self.reader, post=post)
+                for _ in range(total))
+            queries, bump = self.delete_queries(post)
+            bump.assert_called_once()
+            counts.append(queries)
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(self.stats(self.user).posts_count, 0)
+
+    def test_user_delete_bumps_feeds_once(self):
+        """Удаление автора сбрасывает ленты один раз, а не на каждый пост"""
+        counts = []
+        for total in (2, 20):
+            author = User.objects.create_user(username=f'prolific{total}')
+            Post.objects.bulk_create(
+                Post(text='text', author=author) for _ in range(total))
+            Comment.objects.bulk_create(
+                Comment(text='comment', author=self.reader, post=post)
+                for post in Post.objects.filter(author=author))
+            queries, bump = self.delete_queries(author)
+            bump.assert_called_once_with('posts', f'author:prolific{total}')
+            counts.append(queries)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_reconcile_command(self):
+        """Команда исправляет расхождение счётчиков"""
+        post = Post.objects.create(text='text', author=self.user)
+        Comment.objects.create(text='comment', author=self.reader, post=post)
+        UserStats.objects.filter(user=self.user).update(posts_count=42)
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        UserStats.objects.filter(user=self.reader).delete()
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(self.stats(self.user).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_profile_does_not_count(self):
+        """Профиль берёт число постов из счётчика"""
+        Post.objects.create(text='text', author=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().get(
+                reverse('posts:profile',
+                        kwargs={'username': self.user.username}))
+        self.assertEqual(response.context['post_count'], 1)
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries)
+        )
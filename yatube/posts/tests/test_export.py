@@ -0,0 +1,75 @@
+import csv
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Group, Post, User
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExportTest(TestCase):
+    """Выгрузка постов автора и группы потоком"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='exporter')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Группа', slug='export', description='')
+        for number in range(5):
+            Post.objects.create(
+                text=f'Пост {number}, с запятой', author=cls.author,
+                group=cls.group if number % 2 else None)
+        Post.objects.create(text='чужой', author=cls.other, group=cls.group)
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_profile_jsonl(self):
+        response = self.client.get(reverse(
+            'posts:profile_export', kwargs={'username': 'exporter'}))
+        self.assertEqual(
+            response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line)
+                for line in self.content(response).splitlines()]
+        self.assertEqual(
+            [row['text'] for row in rows],
+            [f'Пост {number}, с запятой' for number in range(5)]
+        )
+        self.assertEqual(rows[1]['group'], 'export')
+        self.assertIsNone(rows[0]['group'])
+        self.assertEqual(rows[0]['author'], 'exporter')
+
+    def test_group_csv(self):
+        response = self.client.get(
+            reverse('posts:group_export', kwargs={'slug': 'export'}),
+            {'format': 'csv'}
+        )
+        self.assertIn('export-posts.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(self.content(response))))
+        self.assertEqual(
+            [row['text'] for row in rows],
+            ['Пост 1, с запятой', 'Пост 3, с запятой', 'чужой']
+        )
+
+    def test_unknown_author(self):
+        response = self.client.get(reverse(
+            'posts:profile_export', kwargs={'username': 'nobody'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'posts.csv')
+            call_command('export_posts', author='exporter',
+                         file_format='csv', output=path, chunk_size=1)
+            with open(path, encoding='utf-8', newline='') as file:
+                rows = list(csv.DictReader(file))
+        self.assertEqual(len(rows), 5)
+        out = StringIO()
+        call_command('export_posts', group='export', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
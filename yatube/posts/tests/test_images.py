@@ -0,0 +1,425 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image, ImageFile
+from sorl.thumbnail import get_thumbnail
+
+from ..caching import get_generations, page_key
+from ..images import (PENDING_KEY, prefetch_thumbnails, queue_thumbnails,
+                      render_thumbnails, thumbnail_file, thumbnail_jobs)
+from ..management.commands import gc_images
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(name='image.png', size=(1200, 800), color=(200, 30, 30),
+               image_format='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, image_format)
+    return SimpleUploadedFile(
+        name, buffer.getvalue(), f'image/{image_format.lower()}')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailPipelineTest(TestCase):
+    """Превью готовятся при загрузке, а не при первой отрисовке"""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='uploader')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        cache.clear()
+
+    def thumbnail_path(self, post):
+        geometry, options = settings.THUMBNAIL_PRESETS['card']
+        return os.path.join(
+            TEMP_MEDIA_ROOT,
+            get_thumbnail(post.image, geometry, **options).name
+        )
+
+    def test_thumbnail_is_rendered_on_create(self):
+        self.client.post(
+            reverse('posts:post_create'),
+            {'text': 'text', 'image': make_image()}
+        )
+        post = Post.objects.get(author=self.user)
+        self.assertTrue(post.image)
+        self.assertTrue(os.path.exists(self.thumbnail_path(post)))
+
+    def test_variants_manifest_and_srcset(self):
+        self.client.post(
+            reverse('posts:post_create'),
+            {'text': 'text', 'image': make_image('variants.png')}
+        )
+        post = Post.objects.get(author=self.user)
+        manifest = json.loads(post.image_variants)
+        self.assertEqual(list(manifest), ['image/webp', 'image/png'])
+        for mime, variants in manifest.items():
+            self.assertEqual(
+                [width for width, _ in variants],
+                list(settings.IMAGE_VARIANT_WIDTHS)
+            )
+            for _, name in variants:
+                with self.subTest(name=name):
+                    self.assertTrue(
+                        os.path.exists(os.path.join(TEMP_MEDIA_ROOT, name)))
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.id}))
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ])
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, manifest['image/png'][0][1])
+
+    def test_webp_upload_lists_each_variant_once(self):
+        self.client.post(
+            reverse('posts:post_create'),
+            {'text': 'text',
+             'image': make_image('variants.webp', image_format='WEBP')}
+        )
+        post = Post.objects.get(author=self.user)
+        manifest = json.loads(post.image_variants)
+        self.assertEqual(list(manifest), ['image/webp'])
+        self.assertEqual(
+            [width for width, _ in manifest['image/webp']],
+            list(settings.IMAGE_VARIANT_WIDTHS)
+        )
+        self.assertEqual(
+            len(thumbnail_jobs(post.image.name)),
+            len(settings.THUMBNAIL_PRESETS)
+            + len(settings.IMAGE_VARIANT_WIDTHS)
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id}))
+        self.assertContains(response, ' 480w', count=1)
+
+    def test_pending_image_renders_placeholder(self):
+        post = Post.objects.create(
+            text='text', author=self.user, image=make_image('pending.png'))
+        cache.set(PENDING_KEY.format(post.image.name), True)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id}))
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
+        self.assertNotContains(response, 'class="card-img my-2" src=')
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_process_pool_renders_thumbnail(self):
+        post = Post.objects.create(
+            text='text', author=self.user, image=make_image('pool.png'))
+        future = queue_thumbnails(post)
+        # флаг снимает обратный вызов готовой задачи
+        pending = cache.get(PENDING_KEY.format(post.image.name))
+        self.assertTrue(pending or future.done())
+        future.result(timeout=60)
+        self.assertTrue(os.path.exists(self.thumbnail_path(post)))
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_finished_job_resets_post_pages(self):
+        """Готовые превью сбрасывают ленты и страницу поста"""
+        post = Post.objects.create(
+            text='text', author=self.user, image=make_image('done.png'))
+        scopes = ['posts', f'post:{post.pk}', 'author:uploader']
+        before = get_generations(scopes)
+        future = queue_thumbnails(post)
+        future.result(timeout=60)
+        deadline = time.monotonic() + 5
+        while (cache.get(PENDING_KEY.format(post.image.name))
+               and time.monotonic() < deadline):
+            time.sleep(0.01)
+        for scope, old, new in zip(scopes, before, get_generations(scopes)):
+            with self.subTest(scope=scope):
+                self.assertNotEqual(old, new)
+
+    def test_page_with_placeholder_is_not_cached(self):
+        post = Post.objects.create(
+            text='text', author=self.user, image=make_image('feed.png'))
+        url = reverse('posts:main_page')
+        request = RequestFactory().get(url)
+        cache.set(PENDING_KEY.format(post.image.name), True)
+        self.assertContains(self.client.get(url), 'aspect-ratio')
+        self.assertIsNone(
+            cache.get(page_key(request, get_generations(['posts']))))
+        cache.delete(PENDING_KEY.format(post.image.name))
+        self.assertNotContains(self.client.get(url), 'aspect-ratio')
+        self.assertIsNotNone(
+            cache.get(page_key(request, get_generations(['posts']))))
+
+    def test_render_into_other_media_root(self):
+        """Воркер пишет превью в переданный каталог, а не в MEDIA_ROOT"""
+        post = Post.objects.create(
+            text='text', author=self.user,
+            image=make_image('moved.png', color=(12, 34, 56)))
+        other_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other_root)
+        source = os.path.join(other_root, post.image.name)
+        os.makedirs(os.path.dirname(source))
+        shutil.copy(post.image.path, source)
+        cache.clear()
+        render_thumbnails(post.image.name, other_root)
+        geometry, options = settings.THUMBNAIL_PRESETS['card']
+        name = thumbnail_file(post.image, geometry, options).name
+        self.assertTrue(os.path.exists(os.path.join(other_root, name)))
+        self.assertFalse(
+            os.path.exists(os.path.join(TEMP_MEDIA_ROOT, name)))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailPrefetchTest(TestCase):
+    """Метаданные превью читаются одним запросом на страницу"""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='gallery')
+        for number in range(4):
+            post = Post.objects.create(
+                text=f'text {number}', author=user,
+                image=make_image(
+                    f'gallery{number}.png', (100, 60), (number, 0, 0)))
+            geometry, options = settings.THUMBNAIL_PRESETS['card']
+            get_thumbnail(post.image, geometry, **options)
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def kvstore_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        return response, [
+            query for query in context.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+
+    def test_feed_page_reads_kvstore_once(self):
+        response, queries = self.kvstore_queries(reverse('posts:main_page'))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.content.count(b'class="card-img my-2"'), 4)
+
+    def test_prefetch_marks_pending_images(self):
+        posts = list(Post.objects.all())
+        cache.set(PENDING_KEY.format(posts[0].image.name), True)
+        prefetch_thumbnails(posts)
+        pending, thumbnail = posts[0].thumbnails['card']
+        self.assertTrue(pending)
+        pending, thumbnail = posts[1].thumbnails['card']
+        self.assertFalse(pending)
+        self.assertEqual(thumbnail.x, 960)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ImageMetadataTest(TestCase):
+    """Размеры и хэш картинки сохраняются вместе с постом"""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='measured')
+        self.upload = make_image('measured.png', (300, 200))
+        self.post = Post.objects.create(
+            text='text', author=self.user, image=self.upload)
+
+    def test_metadata_for_new_upload(self):
+        content = self.upload.open().read()
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height), (300, 200))
+        self.assertEqual(self.post.image_size, len(content))
+        self.assertEqual(
+            self.post.image_hash, hashlib.sha256(content).hexdigest())
+
+    def test_metadata_kept_and_cleared(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'edited'
+        with patch('posts.signals.image_metadata') as image_metadata:
+            post.save()
+        image_metadata.assert_not_called()
+        self.assertEqual(Post.objects.get(pk=post.pk).image_width, 300)
+        post.image = None
+        post.save()
+        post = Post.objects.get(pk=post.pk)
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_hash, '')
+
+    def test_backfill_command(self):
+        Post.objects.update(
+            image_width=None, image_height=None, image_size=None,
+            image_hash='')
+        Post.objects.create(
+            text='lost', author=self.user, image='posts/lost.png')
+        out = StringIO()
+        call_command('backfill_image_metadata', workers=1, stdout=out)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (300, 200))
+        self.assertEqual(len(post.image_hash), 64)
+        self.assertIn('Обновлено постов: 1, файлов не найдено: 1',
+                      out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ContentAddressedStorageTest(TestCase):
+    """Одинаковые картинки хранятся один раз, сироты удаляются"""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='hashed')
+        self.storage = Post._meta.get_field('image').storage
+
+    def test_identical_uploads_share_file(self):
+        first = Post.objects.create(
+            text='first', author=self.user, image=make_image('one.png'))
+        second = Post.objects.create(
+            text='second', author=self.user, image=make_image('two.png'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            first.image.name,
+            f'posts/{first.image_hash[:2]}/{first.image_hash}.png'
+        )
+        self.assertEqual(
+            len(self.storage.listdir(f'posts/{first.image_hash[:2]}')[1]), 1)
+
+    def test_gc_removes_orphans_and_their_thumbnails(self):
+        kept = Post.objects.create(
+            text='kept', author=self.user,
+            image=make_image('kept.png', color=(0, 0, 0)))
+        orphan = Post.objects.create(
+            text='orphan', author=self.user,
+            image=make_image('orphan.png', (640, 480)))
+        queue_thumbnails(orphan)
+        name = orphan.image.name
+        manifest = json.loads(orphan.image_variants)
+        orphan.delete()
+        out = StringIO()
+        call_command('gc_images', grace=0, stdout=out)
+        self.assertFalse(self.storage.exists(name))
+        self.assertTrue(self.storage.exists(kept.image.name))
+        for variants in manifest.values():
+            for _, variant in variants:
+                with self.subTest(variant=variant):
+                    self.assertFalse(os.path.exists(
+                        os.path.join(TEMP_MEDIA_ROOT, variant)))
+        self.assertIn('Удалено картинок: 1', out.getvalue())
+
+    def test_reused_orphan_survives_running_gc(self):
+        """Файл, который переиспользовали во время сборки, не удаляется"""
+        orphan = Post.objects.create(
+            text='old', author=self.user,
+            image=make_image('old.png', (64, 48), (90, 10, 10)))
+        name = orphan.image.name
+        orphan.delete()
+        week_ago = time.time() - 7 * 24 * 60 * 60
+        os.utime(self.storage.path(name), (week_ago, week_ago))
+        walk = gc_images.walk
+
+        def walk_and_reupload(storage, directory):
+            yield from walk(storage, directory)
+            Post.objects.create(
+                text='new', author=self.user,
+                image=make_image('new.png', (64, 48), (90, 10, 10)))
+
+        with patch.object(gc_images, 'walk', walk_and_reupload):
+            call_command('gc_images', stdout=StringIO())
+        self.assertTrue(self.storage.exists(name))
+        self.assertGreater(
+            os.path.getmtime(self.storage.path(name)), week_ago)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class UploadLimitsTest(TestCase):
+    """Загрузка ограничена по байтам и пикселям, большие копии ужимаются"""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='limited')
+        self.client.force_login(self.user)
+
+    def create(self, upload):
+        return self.client.post(
+            reverse('posts:post_create'), {'text': 'text', 'image': upload})
+
+    @override_settings(UPLOAD_MAX_BYTES=1024)
+    def test_upload_over_byte_budget(self):
+        noise = Image.frombytes('RGB', (64, 64), os.urandom(64 * 64 * 3))
+        buffer = BytesIO()
+        noise.save(buffer, 'PNG')
+        response = self.create(
+            SimpleUploadedFile('noise.png', buffer.getvalue(), 'image/png'))
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 1,0\xa0КБ')
+        self.assertFalse(Post.objects.filter(author=self.user).exists())
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=100 * 100)
+    def test_upload_over_pixel_budget(self):
+        with patch.object(ImageFile.ImageFile, 'load') as load:
+            response = self.create(make_image('huge.png', (200, 200)))
+        load.assert_not_called()
+        self.assertFormError(
+            response, 'form', 'image', 'В картинке больше 10000 пикселей')
+
+    @override_settings(IMAGE_MAX_SIDE=100)
+    def test_oversized_original_is_downscaled(self):
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200), (10, 120, 10)).save(buffer, 'JPEG')
+        self.create(
+            SimpleUploadedFile('wide.jpg', buffer.getvalue(), 'image/jpeg'))
+        post = Post.objects.get(author=self.user)
+        self.assertEqual((post.image_width, post.image_height), (100, 50))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (100, 50))
+
+    @override_settings(IMAGE_MAX_SIDE=100)
+    def test_oversized_camera_mpo_is_saved_as_jpeg(self):
+        buffer = BytesIO()
+        frames = [Image.new('RGB', (400, 200), (10, 120, 11 + number))
+                  for number in range(2)]
+        frames[0].save(buffer, 'MPO', save_all=True,
+                       append_images=frames[1:])
+        buffer.seek(0)
+        with Image.open(buffer) as image:
+            self.assertEqual(image.format, 'MPO')
+        # Pillow 8 из requirements.txt MPO не пишет
+        with patch.dict(Image.SAVE):
+            Image.SAVE.pop('MPO', None)
+            self.create(SimpleUploadedFile(
+                'camera.jpg', buffer.getvalue(), 'image/jpeg'))
+        post = Post.objects.get(author=self.user)
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (100, 50))
@@ -0,0 +1,167 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from ..caching import get_generations
+from ..models import (Comment, Follow, Group, Post, TimelineEntry, User,
+                      UserStats)
+from ..search import SearchPaginator
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImportPostsTest(TestCase):
+    """Массовый импорт постов и комментариев"""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.writer = User.objects.create_user(username='writer')
+        self.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.reader, author=self.writer)
+        self.group = Group.objects.create(
+            title='Группа', slug='imported', description='')
+        self.source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+
+    def write(self, name, content):
+        path = os.path.join(self.source, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command('import_posts', path, *args, stdout=out,
+                     stderr=StringIO())
+        return out.getvalue()
+
+    def test_jsonl_import(self):
+        buffer = BytesIO()
+        Image.new('RGB', (40, 30), (1, 2, 3)).save(buffer, 'PNG')
+        with open(os.path.join(self.source, 'cat.png'), 'wb') as file:
+            file.write(buffer.getvalue())
+        records = [
+            {'text': 'Импортированный пост', 'author': 'writer',
+             'group': 'imported', 'pub_date': '2020-01-02T03:04:05+00:00',
+             'image': 'cat.png',
+             'comments': [{'author': 'reader', 'text': 'Привет'}]},
+            {'text': 'Второй пост', 'author': 'writer'},
+            {'text': 'Чужой пост', 'author': 'stranger'},
+            {'text': 'Пост без группы', 'author': 'writer', 'group': 'nope'},
+        ]
+        path = self.write('posts.jsonl', '\n'.join(map(json.dumps, records)))
+        scopes = ['posts', 'group:imported', 'author:writer']
+        before = get_generations(scopes)
+        out = self.run_import(path, '--batch-size=1',
+                              f'--images-root={self.source}')
+        self.assertIn('Импортировано постов: 2, комментариев: 1, '
+                      'пропущено: 2', out)
+        post = Post.objects.get(text='Импортированный пост')
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual((post.image_width, post.image_height), (40, 30))
+        self.assertTrue(post.image.storage.exists(post.image.name))
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(
+            Comment.objects.get(author=self.reader).post, post)
+        self.writer.stats.refresh_from_db()
+        self.assertEqual(self.writer.stats.posts_count, 2)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 2)
+        self.assertEqual(
+            [found.pk for found in SearchPaginator(10).search('второй')],
+            [Post.objects.get(text='Второй пост').pk]
+        )
+        for scope, old, new in zip(scopes, before, get_generations(scopes)):
+            with self.subTest(scope=scope):
+                self.assertNotEqual(old, new)
+        new = Post.objects.create(text='После импорта', author=self.writer)
+        self.assertGreater(new.pk, post.pk)
+
+    def test_csv_creates_users_and_groups(self):
+        path = self.write(
+            'posts.csv',
+            'text,author,group,pub_date\n'
+            'Пост из CSV,newcomer,fresh,2019-05-06 07:08:09\n'
+        )
+        self.run_import(path, '--create-users', '--create-groups')
+        post = Post.objects.get(text='Пост из CSV')
+        self.assertEqual(post.author.username, 'newcomer')
+        self.assertFalse(post.author.has_usable_password())
+        self.assertEqual(post.group.slug, 'fresh')
+        self.assertEqual(post.author.stats.posts_count, 1)
+
+    def test_csv_comments_column_is_json(self):
+        content = StringIO()
+        csv.writer(content).writerows([
+            ('text', 'author', 'comments'),
+            ('Пост с комментарием', 'writer',
+             json.dumps([{'author': 'reader', 'text': 'Из CSV'}])),
+            ('Пост без комментариев', 'writer', ''),
+        ])
+        path = self.write('posts.csv', content.getvalue())
+        self.run_import(path)
+        post = Post.objects.get(text='Пост с комментарием')
+        self.assertEqual(
+            list(post.comments.values_list('author__username', 'text')),
+            [('reader', 'Из CSV')],
+        )
+        self.assertFalse(
+            Comment.objects.filter(post__text='Пост без комментариев'))
+
+    def test_csv_comments_column_rejects_plain_text(self):
+        path = self.write(
+            'posts.csv',
+            'text,author,comments\n'
+            'Пост,writer,просто текст\n'
+        )
+        with self.assertRaisesMessage(CommandError, 'Строка 2'):
+            self.run_import(path)
+        self.assertFalse(Post.objects.filter(text='Пост'))
+
+    def test_malformed_records_abort_with_line_number(self):
+        cases = {
+            'not an object': '[1, 2]',
+            'bad date': json.dumps({'text': 'Пост', 'author': 'writer',
+                                    'pub_date': '2020-13-45 00:00'}),
+            'unparsable date': json.dumps({'text': 'Пост', 'author': 'writer',
+                                           'pub_date': 'вчера'}),
+            'comment not an object': json.dumps(
+                {'text': 'Пост', 'author': 'writer', 'comments': ['Привет']}),
+            'author not a string': json.dumps(
+                {'text': 'Пост', 'author': ['writer']}),
+        }
+        valid = json.dumps({'text': 'Первый', 'author': 'writer'})
+        for name, line in cases.items():
+            with self.subTest(name):
+                path = self.write('posts.jsonl', f'{valid}\n\n{line}\n')
+                with self.assertRaisesMessage(CommandError, 'Строка 3'):
+                    self.run_import(path)
+
+    def test_only_imported_counters_are_recounted(self):
+        old = Post.objects.create(text='Старый пост', author=self.reader)
+        Post.objects.filter(pk=old.pk).update(comments_count=42)
+        UserStats.objects.filter(user=self.reader).update(posts_count=42)
+        records = [{'text': 'Новый', 'author': 'writer',
+                    'comments': [{'author': 'reader', 'text': 'Привет'}]}]
+        path = self.write('posts.jsonl', '\n'.join(map(json.dumps, records)))
+        self.run_import(path)
+        self.assertEqual(Post.objects.get(text='Новый').comments_count, 1)
+        self.assertEqual(UserStats.objects.get(
+            user=self.writer).posts_count, 1)
+        old.refresh_from_db()
+        self.assertEqual(old.comments_count, 42)
+        self.assertEqual(UserStats.objects.get(
+            user=self.reader).posts_count, 42)
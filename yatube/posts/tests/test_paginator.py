@@ -1,7 +1,12 @@
+from django.core.cache import cache
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from ..counters import reconcile
 from ..models import Group, Post, User
+from ..paginators import ELLIPSIS, CountedCursorPaginator
 
 from yatube.settings import POST_COUNT
 
@@ -66,3 +71,159 @@ class PaginatorTest(TestCase):
                                         kwargs={'username': self.user}
                                         ) + '?page=2')
         self.assertEqual(len(response.context['page_obj']), POST_PAGE_3_CNT)
+
+
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='cursor')
+        Post.objects.bulk_create(
+            Post(text=f'text{i}', author=cls.user) for i in range(POSTS * 2)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def get_page(self, query=''):
+        return self.client.get(reverse('posts:main_page') + query)
+
+    def test_cursor_walks_all_posts_once(self):
+        """Курсоры проходят ленту целиком без пропусков и повторов"""
+        response = self.get_page()
+        seen = [post.id for post in response.context['page_obj']]
+        page_obj = response.context['page_obj']
+        while page_obj.has_next():
+            response = self.get_page(f'?cursor={page_obj.next_cursor}')
+            page_obj = response.context['page_obj']
+            seen.extend(post.id for post in page_obj)
+        expected = list(
+            Post.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_cursor_handles_equal_pub_dates(self):
+        """При одинаковой дате порядок добивается по id"""
+        Post.objects.update(pub_date=Post.objects.first().pub_date)
+        self.test_cursor_walks_all_posts_once()
+
+    def test_previous_cursor_returns_previous_page(self):
+        """Курсор назад возвращает ту же страницу, что и переход по номеру"""
+        second = self.get_page('?page=2').context['page_obj']
+        third = self.get_page(f'?cursor={second.next_cursor}').context[
+            'page_obj']
+        back = self.get_page(f'?cursor={third.previous_cursor}').context[
+            'page_obj']
+        self.assertEqual(back.number, 2)
+        self.assertEqual(list(back), list(second))
+
+    def test_no_count_query(self):
+        """Страница ленты не выполняет COUNT(*)"""
+        page_obj = self.get_page().context['page_obj']
+        with CaptureQueriesContext(connection) as queries:
+            self.get_page(f'?cursor={page_obj.next_cursor}')
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries)
+        )
+
+    def test_bad_cursor_and_deep_page_fall_back_to_first(self):
+        """Испорченный курсор и далёкий ?page= ведут на первую страницу"""
+        for query in ('?cursor=garbage', '?page=5000'):
+            with self.subTest(query=query):
+                page_obj = self.get_page(query).context['page_obj']
+                self.assertEqual(page_obj.number, 1)
+                self.assertEqual(len(page_obj), POST_COUNT)
+
+
+class ElidedPaginatorTest(TestCase):
+    """Ряд ссылок вокруг текущей страницы и число страниц из счётчика"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='elided')
+        Post.objects.bulk_create(
+            Post(text=f'text{i}', author=cls.user)
+            for i in range(POST_COUNT * 5 + 3)
+        )
+        reconcile()
+        cls.posts = Post.objects.filter(author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def get_page(self, query=''):
+        url = reverse('posts:profile', kwargs={'username': 'elided'})
+        return self.client.get(url + query).context['page_obj']
+
+    def numbers(self, page_obj):
+        return [link.number for link in page_obj.links]
+
+    def test_first_page_links(self):
+        page_obj = self.get_page()
+        self.assertEqual(self.numbers(page_obj), [1, 2, ELLIPSIS, 6])
+        self.assertEqual(
+            [link.query for link in page_obj.links],
+            [None, 'page=2', None, 'page=last']
+        )
+
+    def test_middle_page_links(self):
+        page_obj = self.get_page()
+        for _ in range(3):
+            page_obj = self.get_page(f'?cursor={page_obj.next_cursor}')
+        self.assertEqual(page_obj.number, 4)
+        self.assertEqual(self.numbers(page_obj), [1, 2, 3, 4, 5, 6])
+        cache.clear()
+        page_obj = self.get_page('?page=2')
+        page_obj = self.get_page(f'?cursor={page_obj.next_cursor}')
+        self.assertEqual(self.numbers(page_obj),
+                         [1, 2, 3, 4, ELLIPSIS, 6])
+
+    def test_last_page(self):
+        """?page=last отдаёт хвост ленты, а курсор назад - пятую страницу"""
+        last = self.get_page('?page=last')
+        self.assertEqual(last.number, 6)
+        self.assertEqual(
+            list(last), list(self.posts.order_by('pub_date', 'id')[:3])[::-1])
+        self.assertFalse(last.has_next())
+        fifth = self.get_page(f'?cursor={last.previous_cursor}')
+        self.assertEqual(fifth.number, 5)
+        self.assertEqual(
+            list(fifth), list(self.posts.order_by('-pub_date', '-id')[40:50]))
+
+    def test_profile_uses_denormalized_counter(self):
+        """Профиль берёт число постов из счётчика автора, без COUNT(*)"""
+        with CaptureQueriesContext(connection) as queries:
+            self.get_page()
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries))
+
+    def test_count_is_cached(self):
+        """COUNT(*) ленты выполняется один раз на время жизни кэша"""
+        expected = Post.objects.count()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:main_page'))
+        self.assertTrue(any('COUNT(' in query['sql'] for query in queries))
+        Post.objects.create(text='новый', author=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:main_page') + '?page=2')
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries))
+        self.assertEqual(
+            response.context['page_obj'].paginator.count, expected)
+
+    def test_stale_count_does_not_promise_next_page(self):
+        """Завышенный счётчик не рисует ссылку на несуществующую страницу"""
+        paginator = CountedCursorPaginator(self.posts, POST_COUNT, count=1000)
+        page_obj = paginator.get_page(1)
+        self.assertEqual(self.numbers(page_obj), [1, 2, ELLIPSIS, 100])
+        page_obj = paginator.get_page('last')
+        self.assertEqual(page_obj.number, 100)
+        self.assertFalse(page_obj.has_next())
+        self.assertIsNone(page_obj.next_cursor)
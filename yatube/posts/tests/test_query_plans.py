@@ -0,0 +1,94 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+SCAN = re.compile(r'^SCAN (TABLE )?\w+(?P<index> USING (COVERING )?INDEX)?')
+
+# Запросы, которым скан положен по замыслу
+ALLOWED_SCANS = {
+    # число постов главной ленты для номера последней страницы;
+    # cached_count кэширует его на COUNT_CACHE_TIMEOUT
+    'SELECT COUNT(*) AS "__count" FROM "posts_post"',
+}
+
+
+def allowed_scan(sql, step):
+    """Скан разрешён в списке выше и в ленте без фильтра.
+
+    Лента без WHERE обходит индекс в порядке сортировки и
+    останавливается на LIMIT - читает ровно одну страницу.
+    """
+    match = SCAN.match(step)
+    if match is None or sql in ALLOWED_SCANS:
+        return True
+    return bool(match['index']) and ' WHERE ' not in sql and ' LIMIT ' in sql
+
+
+class QueryPlanTest(TestCase):
+    """Запросы страниц идут по индексам, без полного скана и сортировки"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='planner')
+        cls.author = User.objects.create_user(username='planned')
+        cls.group = Group.objects.create(
+            title='title',
+            slug='plan-slug',
+            description='description'
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for i in range(15):
+            post = Post.objects.create(
+                text=f'text{i}',
+                author=cls.author,
+                group=cls.group
+            )
+        Comment.objects.create(text='comment', author=cls.user, post=post)
+        cls.post = post
+
+    def setUp(self):
+        cache.clear()
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user)
+
+    def tearDown(self):
+        cache.clear()
+
+    def urls(self):
+        urls = [
+            reverse('posts:main_page'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls[:]:
+            page_obj = self.auth_client.get(url).context.get('page_obj')
+            if page_obj is not None and page_obj.has_next():
+                urls.append(f'{url}?cursor={page_obj.next_cursor}')
+            cache.clear()
+        return urls
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_views_use_indexes(self):
+        for url in self.urls():
+            with CaptureQueriesContext(connection) as queries:
+                self.auth_client.get(url)
+            for query in queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                for step in self.explain(query['sql']):
+                    with self.subTest(url=url, sql=query['sql'], step=step):
+                        self.assertNotIn('TEMP B-TREE', step)
+                        self.assertTrue(allowed_scan(query['sql'], step))
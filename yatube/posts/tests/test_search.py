@@ -0,0 +1,92 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Post
+from ..search import SearchPaginator, match_expression
+
+User = get_user_model()
+
+
+class MatchExpressionTest(TestCase):
+    """Запрос пользователя превращается в безопасное выражение MATCH"""
+    def test_words_are_quoted(self):
+        self.assertEqual(
+            match_expression('лев OR "тигр*'), '"лев" "OR" "тигр"*')
+        self.assertEqual(match_expression(' -- '), '')
+
+
+@override_settings(POST_COUNT=2)
+class SearchTest(TestCase):
+    """Полнотекстовый поиск по постам"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='searcher')
+        cls.staff = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.posts = Post.objects.bulk_create([
+            Post(text='Кот сидит на окне', author=cls.user),
+            Post(text='Кот, кот и ещё раз кот', author=cls.user),
+            Post(text='Котлеты на обед', author=cls.user),
+            Post(text='Собака спит', author=cls.user),
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, cursor=None):
+        return SearchPaginator(10).search(query, cursor)
+
+    def texts(self, page):
+        return [post.text for post in page]
+
+    def test_bulk_created_posts_are_indexed(self):
+        self.assertEqual(self.texts(self.search('собака')), ['Собака спит'])
+
+    def test_rank_and_prefix(self):
+        texts = self.texts(self.search('кот'))
+        self.assertEqual(texts[0], 'Кот, кот и ещё раз кот')
+        self.assertCountEqual(
+            texts[1:], ['Кот сидит на окне', 'Котлеты на обед'])
+        self.assertEqual(self.texts(self.search('кот окно')), [])
+        self.assertEqual(
+            self.texts(self.search('кот окне')), ['Кот сидит на окне'])
+
+    def test_index_follows_update_and_delete(self):
+        post = Post.objects.get(text='Собака спит')
+        post.text = 'Собака гуляет'
+        post.save()
+        self.assertEqual(self.texts(self.search('спит')), [])
+        self.assertEqual(self.texts(self.search('гуляет')), [post.text])
+        post.delete()
+        self.assertEqual(self.texts(self.search('собака')), [])
+
+    def test_cursor_pages(self):
+        response = self.client.get(reverse('posts:search'), {'q': 'кот'})
+        first = response.context['page_obj']
+        self.assertEqual(len(first), 2)
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%82&amp;cursor=')
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'кот', 'cursor': first.next_cursor})
+        second = response.context['page_obj']
+        self.assertEqual(second.number, 2)
+        self.assertCountEqual(
+            self.texts(first) + self.texts(second),
+            self.texts(self.search('кот'))
+        )
+        self.assertFalse(second.has_next())
+
+    def test_empty_query(self):
+        response = self.client.get(reverse('posts:search'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+        self.assertNotContains(response, 'Ничего не нашлось')
+
+    def test_admin_uses_index(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'котлеты'})
+        self.assertEqual(
+            [post.text for post in response.context['cl'].result_list],
+            ['Котлеты на обед']
+        )
@@ -0,0 +1,82 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..cards import card_key
+from ..models import Comment, Follow, Group, Post, User
+
+
+@override_settings(FEED_TEMPLATE_ENGINE='jinja2')
+class JinjaTemplatesTest(TestCase):
+    """Ленты и страница поста рисуются и шаблонами Jinja2"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='jinja', first_name='Имя', last_name='Автора')
+        cls.reader = User.objects.create_user(username='jinja-reader')
+        cls.group = Group.objects.create(
+            title='Группа Jinja', slug='jinja', description='описание')
+        cls.post = Post.objects.create(
+            text='Текст из Jinja', author=cls.author, group=cls.group)
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_pages(self):
+        pages = {
+            reverse('posts:main_page'): 'Избранные авторы',
+            reverse('posts:group_list', kwargs={'slug': 'jinja'}):
+                'Группа Jinja',
+            reverse('posts:profile', kwargs={'username': 'jinja'}):
+                'Отписаться',
+            reverse('posts:follow_index'): 'Подписки',
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}):
+                'комментарий',
+        }
+        for url, marker in pages.items():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Текст из Jinja')
+                self.assertContains(response, marker)
+                self.assertContains(
+                    response, 'Пользователь: jinja-reader')
+                self.assertNotContains(response, '<!--hole:')
+
+    def test_comment_form(self):
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}))
+        self.assertContains(response, 'name="csrfmiddlewaretoken"')
+        self.assertContains(response, 'class="form-control"')
+
+    def test_cards_are_rendered_by_jinja(self):
+        """Карточки ленты Jinja2 рисует макрос, а не шаблон Django"""
+        response = self.client.get(reverse('posts:main_page'))
+        self.assertTemplateNotUsed(response, 'posts/includes/post_card.html')
+        self.assertContains(response, 'Автор: Имя Автора')
+        self.assertContains(response, reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.id}))
+        self.assertContains(response, reverse(
+            'posts:group_list', kwargs={'slug': 'jinja'}))
+        self.assertNotEqual(card_key(self.post, 'jinja2'),
+                            card_key(self.post, 'django'))
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('bench_templates', repeat=1, stdout=out,
+                     stderr=StringIO())
+        output = out.getvalue()
+        self.assertIn('posts/post_detail.html', output)
+        self.assertIn('posts/group_list.html', output)
+        for state in ('cold', 'warm'):
+            self.assertRegex(output, rf'posts/index.html\s+{state}\s')
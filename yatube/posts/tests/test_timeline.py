@@ -0,0 +1,62 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Follow, Post, TimelineEntry, User
+
+
+class TimelineTest(TestCase):
+    """Проверка материализованной ленты подписок"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.writer = User.objects.create_user(username='writer')
+        cls.old_post = Post.objects.create(text='old', author=cls.writer)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def follow(self):
+        self.client.get(reverse('posts:profile_follow',
+                                kwargs={'username': self.writer.username}))
+
+    def timeline_posts(self):
+        return list(
+            TimelineEntry.objects.filter(user=self.reader).values_list(
+                'post_id', flat=True)
+        )
+
+    def test_follow_backfills_timeline(self):
+        """Подписка добавляет в ленту старые посты автора"""
+        self.follow()
+        self.assertEqual(self.timeline_posts(), [self.old_post.id])
+
+    def test_new_post_fans_out(self):
+        """Новый пост попадает в ленты подписчиков"""
+        self.follow()
+        post = Post.objects.create(text='new', author=self.writer)
+        self.assertEqual(self.timeline_posts(), [post.id, self.old_post.id])
+
+    def test_unfollow_prunes_timeline(self):
+        """Отписка убирает посты автора из ленты"""
+        self.follow()
+        self.client.get(reverse('posts:profile_unfollow',
+                                kwargs={'username': self.writer.username}))
+        self.assertEqual(self.timeline_posts(), [])
+
+    def test_follow_index_reads_timeline(self):
+        """Лента подписок строится по материализованной таблице"""
+        self.follow()
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [self.old_post])
+
+    def test_rebuild_command(self):
+        """Команда пересобирает ленты с нуля"""
+        Follow.objects.create(user=self.reader, author=self.writer)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.timeline_posts(), [self.old_post.id])
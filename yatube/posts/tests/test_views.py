@@ -5,7 +5,9 @@ from django.core.cache import cache
 from django import forms
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from ..models import Comment, Group, Post, User
@@ -199,3 +201,103 @@ class PostViewsTest(TestCase):
         self.assertRedirects(response,
                              '/auth/login/?next=%2Fposts%2F2%2Fcomment%2F')
         self.assertEqual(Comment.objects.count(), comment_count)
+
+
+class PostDetailQueriesTest(TestCase):
+    """Число запросов страницы поста не зависит от комментариев"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='detail')
+        cls.group = Group.objects.create(
+            title='title', slug='detail', description='description')
+        cls.post = Post.objects.create(
+            text='text', author=cls.author, group=cls.group)
+
+    def get_detail(self):
+        return self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}))
+
+    def test_post_detail_query_count(self):
+        with self.assertNumQueries(2):
+            self.get_detail()
+        for number in range(10):
+            commenter = User.objects.create_user(username=f'reader{number}')
+            Comment.objects.create(
+                post=self.post, author=commenter, text=f'comment {number}')
+        with self.assertNumQueries(2):
+            response = self.get_detail()
+        self.assertEqual(len(response.context['comments']), 10)
+        self.assertEqual(response.context['comments_count'], 10)
+        self.assertEqual(response.context['post_count'], 1)
+        self.assertContains(response, 'reader9')
+
+
+class GroupFeedQueriesTest(TestCase):
+    """Число запросов ленты группы не зависит от числа постов"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='grouped')
+        cls.group = Group.objects.create(
+            title='title', slug='grouped', description='description')
+
+    def count_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(
+                reverse('posts:group_list', kwargs={'slug': 'grouped'}))
+        return len(queries)
+
+    def test_group_feed_query_count(self):
+        Post.objects.create(text='text', author=self.author, group=self.group)
+        single = self.count_queries()
+        for number in range(5):
+            Post.objects.create(
+                text=f'text {number}', author=self.author, group=self.group)
+        self.assertEqual(self.count_queries(), single)
+
+
+@override_settings(COMMENT_COUNT=3)
+class PostCommentsTest(TestCase):
+    """Комментарии выводятся пачками по курсору"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='commented')
+        cls.post = Post.objects.create(text='text', author=cls.author)
+        for number in range(5):
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'comment {number}')
+
+    def test_post_detail_shows_newest_comments(self):
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}))
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            ['comment 4', 'comment 3', 'comment 2']
+        )
+        self.assertContains(response, comments.next_cursor)
+
+    def test_comments_endpoint_continues_by_cursor(self):
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.id})
+        first = self.client.get(url, {'format': 'json'}).json()
+        self.assertEqual(len(first['comments']), 3)
+        second = self.client.get(
+            url, {'format': 'json', 'cursor': first['next_cursor']}).json()
+        self.assertEqual(
+            [comment['text'] for comment in second['comments']],
+            ['comment 1', 'comment 0']
+        )
+        self.assertIsNone(second['next_cursor'])
+        fragment = self.client.get(
+            url, {'cursor': first['next_cursor']},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertTemplateUsed(fragment, 'posts/includes/comment_list.html')
+        self.assertTemplateNotUsed(fragment, 'base.html')
+        self.assertContains(fragment, 'comment 0')
+        self.assertNotContains(fragment, 'comment 4')
+
+    def test_comments_endpoint_unknown_post(self):
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0}))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,51 @@
+from django.conf import settings
+
+from .models import Follow, Post, TimelineEntry
+from .utils import chunks
+
+
+def _insert(entries):
+    for chunk in chunks(entries, settings.TIMELINE_BATCH_SIZE):
+        TimelineEntry.objects.bulk_create(chunk, ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Положить новый пост в ленты всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True).iterator()
+    _insert(
+        TimelineEntry(user_id=user_id, post_id=post.id,
+                      author_id=post.author_id, pub_date=post.pub_date)
+        for user_id in followers
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавить в ленту подписчика все посты автора."""
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('id', 'pub_date').iterator()
+    _insert(
+        TimelineEntry(user_id=user_id, post_id=post_id,
+                      author_id=author_id, pub_date=pub_date)
+        for post_id, pub_date in posts
+    )
+
+
+def prune(user_id, author_id):
+    """Убрать из ленты подписчика посты автора."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(user_ids=None):
+    """Пересобрать ленты с нуля по таблице подписок."""
+    entries = TimelineEntry.objects.all()
+    follows = Follow.objects.all()
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        follows = follows.filter(user_id__in=user_ids)
+    entries.delete()
+    pairs = follows.values_list('user_id', 'author_id')
+    for user_id, author_id in pairs.iterator():
+        backfill(user_id, author_id)
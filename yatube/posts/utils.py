@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+
+
+def chunks(iterable, size):
+    """Разбить итерируемое на списки длиной не больше size."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@contextmanager
+def keep_dates(*models):
+    """Не подменять pub_date текущим временем при массовой записи."""
+    fields = [model._meta.get_field('pub_date') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
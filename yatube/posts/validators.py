@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+
+def validate_upload_size(file):
+    if file.size > settings.UPLOAD_MAX_BYTES:
+        raise ValidationError(
+            'Файл больше %(limit)s',
+            code='too_large',
+            params={'limit': filesizeformat(settings.UPLOAD_MAX_BYTES)},
+        )
+
+
+def validate_image_pixels(file):
+    """Проверить число пикселей по заголовку, не декодируя картинку."""
+    error = ValidationError(
+        'В картинке больше %(limit)d пикселей',
+        code='too_many_pixels',
+        params={'limit': settings.IMAGE_UPLOAD_MAX_PIXELS},
+    )
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        raise error
+    except (OSError, SyntaxError):
+        return
+    finally:
+        file.seek(0)
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise error
@@ -1,87 +1,177 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.utils.http import urlencode
 
+from .caching import cache_feed, conditional_page, post_scopes
+from .cards import prefetch_cards
+from .counters import get_stats
+from .export import export_response
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
-from yatube.settings import POST_COUNT
+from .images import prefetch_thumbnails, queue_thumbnails
+from .models import Follow, Group, Post, TimelineEntry, User
+from .paginators import CursorPaginator, paginate
+from .search import search_page
 
 
-@cache_page(20)
+def followed_scopes(request):
+    """Области ленты подписок - авторы, на которых подписан читатель."""
+    usernames = Follow.objects.filter(user=request.user).values_list(
+        'author__username', flat=True)
+    return [f'author:{username}' for username in usernames]
+
+
+@conditional_page('posts')
+@cache_feed('posts')
 def index(request):
     posts = Post.objects.select_related('author', 'group').all()
-    paginator = Paginator(posts, POST_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, posts)
+    prefetch_cards(page_obj, settings.FEED_TEMPLATE_ENGINE)
     context = {
         'page_obj': page_obj,
     }
-    return render(request, 'posts/index.html', context)
+    return render(request, 'posts/index.html', context,
+                  using=settings.FEED_TEMPLATE_ENGINE)
 
 
+@conditional_page('group:{slug}')
+@cache_feed('group:{slug}')
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group).select_related('author')
-    page = Paginator(posts, POST_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = page.get_page(page_number)
+    posts = Post.objects.filter(group=group).select_related(
+        'author', 'group')
+    page_obj = paginate(request, posts)
+    prefetch_cards(page_obj, settings.FEED_TEMPLATE_ENGINE)
     context = {
         "group": group,
-        "posts": posts,
         'page_obj': page_obj
     }
-    return render(request, "posts/group_list.html", context)
+    return render(request, "posts/group_list.html", context,
+                  using=settings.FEED_TEMPLATE_ENGINE)
 
 
+@conditional_page('author:{username}')
+@cache_feed('author:{username}')
 def profile(request, username):
     template_name = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=author).select_related('group')
-    page = Paginator(posts, POST_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = page.get_page(page_number)
-    post_count = posts.count()
-    following = author.following.exists()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    posts = Post.objects.filter(author=author).select_related(
+        'author', 'group')
+    post_count = get_stats(author).posts_count
+    page_obj = paginate(request, posts, count=post_count)
+    prefetch_cards(page_obj, settings.FEED_TEMPLATE_ENGINE)
     context = {
         'page_obj': page_obj,
         'post_count': post_count,
         'author': author,
-        'following': following
     }
-    return render(request, template_name, context)
+    return render(request, template_name, context,
+                  using=settings.FEED_TEMPLATE_ENGINE)
+
+
+def profile_export(request, username):
+    author = get_object_or_404(User, username=username)
+    return export_response(
+        Post.objects.filter(author=author),
+        request.GET.get('format'),
+        f'{author.username}-posts'
+    )
+
+
+def group_export(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return export_response(
+        Post.objects.filter(group=group),
+        request.GET.get('format'),
+        f'{group.slug}-posts'
+    )
+
+
+@cache_feed('posts')
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = search_page(request)
+    prefetch_cards(page_obj)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
 
 
+@conditional_page(extra_scopes=post_scopes)
 def post_detail(request, post_id):
     template_name = 'posts/post_detail.html'
-    post = get_object_or_404(Post, id=post_id)
-    username = get_object_or_404(User, id=post.author_id)
-    post_count = Post.objects.filter(author=username).count()
-    comments = Comment.objects.filter(post_id=post_id)
-    comments_count = Comment.objects.filter(post_id=post_id).count()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'),
+        id=post_id
+    )
+    author = post.author
+    prefetch_thumbnails([post])
+    comments = CursorPaginator(
+        post.comments.select_related('author'), settings.COMMENT_COUNT
+    ).get_page(1)
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
-        'username': username,
-        'post_count': post_count,
-        'author': username,
+        'username': author,
+        'post_count': get_stats(author).posts_count,
+        'author': author,
         'comments': comments,
         'form': form,
-        'comments_count': comments_count
+        'comments_count': post.comments_count
+    }
+    return render(request, template_name, context,
+                  using=settings.FEED_TEMPLATE_ENGINE)
+
+
+def post_comments(request, post_id):
+    """Следующая пачка комментариев поста по курсору.
+
+    Для XHR отдаётся HTML-фрагмент, для `?format=json` - JSON,
+    иначе - отдельная страница со списком.
+    """
+    post = get_object_or_404(
+        Post.objects.only('id', 'text', 'comments_count'), id=post_id)
+    comments = paginate(
+        request, post.comments.select_related('author'),
+        per_page=settings.COMMENT_COUNT, count=post.comments_count
+    )
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.id,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'pub_date': comment.pub_date.isoformat(),
+                }
+                for comment in comments
+            ],
+            'next_cursor': comments.next_cursor,
+        })
+    template_name = 'posts/comments.html'
+    if request.is_ajax():
+        template_name = 'posts/includes/comment_list.html'
+    context = {
+        'post': post,
+        'comments': comments,
     }
     return render(request, template_name, context)
 
 
 @login_required
 def post_create(request):
-    if request.method == 'POST':
-        form = PostForm(request.POST or None)
-        if form.is_valid():
-            post = form.save(commit=False)
-            post.author = request.user
-            post.save()
-            return redirect('posts:profile', post.author)
-    form = PostForm()
+    form = PostForm(request.POST or None, files=request.FILES or None)
+    if form.is_valid():
+        post = form.save(commit=False)
+        post.author = request.user
+        post.save()
+        queue_thumbnails(post)
+        return redirect('posts:profile', post.author)
     return render(request, 'posts/create_post.html', {'form': form})
 
 
@@ -96,6 +186,8 @@ def post_edit(request, post_id):
                         instance=post)
         if form.is_valid():
             post.save()
+            if 'image' in form.changed_data:
+                queue_thumbnails(post)
             return redirect('posts:post_detail', post_id)
         context = {
             'form': form,
@@ -124,26 +216,26 @@ def add_comment(request, post_id):
 
 
 @login_required
+@conditional_page(extra_scopes=followed_scopes)
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user).select_related('author', 'group')
-    page = Paginator(posts, POST_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = page.get_page(page_number)
+    entries = TimelineEntry.objects.filter(
+        user=request.user).select_related('post__author', 'post__group')
+    page_obj = paginate(request, entries, keys=('pub_date', 'post_id'))
+    page_obj.object_list = [entry.post for entry in page_obj]
+    prefetch_cards(page_obj, settings.FEED_TEMPLATE_ENGINE)
     context = {
-        'posts': posts,
         'page_obj': page_obj
     }
-    return render(request, 'posts/follow.html', context)
+    return render(request, 'posts/follow.html', context,
+                  using=settings.FEED_TEMPLATE_ENGINE)
 
 
 @login_required
 def profile_follow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
-    following = author.following.exists()
-    if author != user and not following:
-        Follow.objects.create(user=user, author=author)
+    if author != user:
+        Follow.objects.get_or_create(user=user, author=author)
     return redirect('posts:profile', username=username)
 
 
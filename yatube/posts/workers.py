@@ -0,0 +1,58 @@
+"""Точки входа процессов-воркеров.
+
+Модуль импортируется в свежем процессе до настройки Django,
+поэтому здесь нельзя импортировать модели и всё, что их тянет.
+"""
+import hashlib
+
+import django
+from PIL import Image
+
+CHUNK_SIZE = 64 * 1024
+EXIF_ORIENTATION = 0x0112
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def init_thumbnail_worker():
+    django.setup()
+
+
+def image_metadata(file):
+    """Ширина, высота, размер в байтах и sha256 картинки.
+
+    Содержимое хэшируется кусками, а Pillow читает только заголовок,
+    так что картинка целиком не декодируется. Для файла, который
+    Pillow не узнал, ширина и высота - None.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    file.seek(0)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    width = height = None
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+            exif = Image.Exif()
+            # getexif() у PNG декодирует всю картинку, info - только заголовок
+            if 'exif' in image.info:
+                exif.load(image.info['exif'])
+            orientation = exif.get(EXIF_ORIENTATION)
+    except (OSError, SyntaxError):
+        pass
+    else:
+        if orientation in ROTATED_ORIENTATIONS:
+            width, height = height, width
+    file.seek(0)
+    return width, height, size, digest.hexdigest()
+
+
+def image_metadata_for_path(path):
+    """То же для файла на диске; для пропавшего файла - None."""
+    try:
+        with open(path, 'rb') as file:
+            return image_metadata(file)
+    except OSError:
+        return None
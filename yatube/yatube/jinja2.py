@@ -0,0 +1,39 @@
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.template.defaultfilters import date, truncatechars
+from django.urls import reverse
+from jinja2 import Environment
+
+from core.holes import hole_marker
+from core.templatetags.user_filters import addclass
+from posts.templatetags.post_images import post_image
+
+
+def url(name, *args, **kwargs):
+    return reverse(name, args=args or None, kwargs=kwargs or None)
+
+
+def hole(template_name, **params):
+    return hole_marker(template_name, params)
+
+
+def environment(**options):
+    """Окружение Jinja2 с теми же помощниками, что и у шаблонов Django.
+
+    `url`, `static` и `hole` повторяют одноимённые теги,
+    `post_image_context` отдаёт контекст тега `post_image` - разметку
+    к нему рисует макрос из `posts/macros.html`. Карточку поста там же
+    рисует макрос `post_card`, а не шаблон Django.
+    """
+    env = Environment(**options)
+    env.globals.update({
+        'url': url,
+        'static': staticfiles_storage.url,
+        'hole': hole,
+        'post_image_context': post_image,
+    })
+    env.filters.update({
+        'date': date,
+        'truncatechars': truncatechars,
+        'addclass': addclass,
+    })
+    return env
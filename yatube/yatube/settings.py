@@ -57,28 +57,49 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.HoleFillingMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if not DEBUG:
+    TEMPLATE_LOADERS = [
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+    ]
+TEMPLATE_CONTEXT_PROCESSORS = [
+    'django.template.context_processors.debug',
+    'django.template.context_processors.request',
+    'django.contrib.auth.context_processors.auth',
+    'django.contrib.messages.context_processors.messages',
+    'core.context_processors.year.year',
+]
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
-            'context_processors': [
-                'django.template.context_processors.debug',
-                'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
-                'core.context_processors.year.year',
-            ],
+            'loaders': TEMPLATE_LOADERS,
+            'context_processors': TEMPLATE_CONTEXT_PROCESSORS,
+        },
+    },
+    {
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'DIRS': [os.path.join(TEMPLATES_DIR, 'jinja2')],
+        'OPTIONS': {
+            'environment': 'yatube.jinja2.environment',
+            'context_processors': TEMPLATE_CONTEXT_PROCESSORS,
         },
     },
 ]
 
+# Каким движком рисовать ленты и страницу поста: 'django' или 'jinja2'
+FEED_TEMPLATE_ENGINE = os.environ.get('FEED_TEMPLATE_ENGINE', 'django')
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
@@ -152,8 +173,59 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')),
+        'OPTIONS': {
+            'MAX_BYTES': 64 * 1024 * 1024,
+            'LOCAL_MAX_AGE': 5,
+            'COMPRESS_MIN_LENGTH': 1024,
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
 
+# Тесты очищают кэш, поэтому получают свой файл вместо CACHE_LOCATION
+TEST_RUNNER = 'yatube.testing.IsolatedCacheRunner'
+
 POST_COUNT = 10
+COMMENT_COUNT = 20
+
+OFFSET_PAGES = 5
+
+COUNT_CACHE_TIMEOUT = 60
+
+EXPORT_CHUNK_SIZE = 2000
+
+POST_CARD_TIMEOUT = 60 * 60 * 24
+
+TIMELINE_BATCH_SIZE = 500
+
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+
+FEED_CACHE_GRACE = 60 * 10
+
+FEED_CACHE_JITTER = 0.1
+
+FEED_CACHE_LOCK_TIMEOUT = 30
+
+FEED_CACHE_LOCK_WAIT = 2
+
+FEED_CACHE_BACKGROUND = True
+
+FEED_GENERATION_TIMEOUT = 60 * 60 * 24 * 30
+
+THUMBNAIL_PRESETS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+THUMBNAIL_WORKERS = 2
+IMAGE_VARIANT_PRESET = 'card'
+IMAGE_VARIANT_WIDTHS = (480, 960, 1440)
+IMAGE_VARIANT_FORMATS = ('WEBP', None)
+IMAGE_SIZES = '(min-width: 992px) 960px, 100vw'
+
+FILE_UPLOAD_HANDLERS = ['core.uploads.CappedUploadHandler']
+UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 50 * 10 ** 6
+IMAGE_MAX_SIDE = 4096
+THUMBNAIL_PENDING_TIMEOUT = 60 * 5
@@ -0,0 +1,45 @@
+import copy
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from posts.images import shutdown_thumbnail_workers
+
+
+@contextmanager
+def isolated_cache():
+    """Файлы общего уровня кэша во временном каталоге.
+
+    Тесты очищают кэш: с файлом из настроек они стирали бы кэш
+    запущенного сервера и кэш параллельного прогона тестов. Перед
+    возвратом настроек дожидаемся нарезок превью: их обратные вызовы
+    пишут в кэш.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        caches = copy.deepcopy(settings.CACHES)
+        for alias, options in caches.items():
+            if options.get('LOCATION'):
+                options['LOCATION'] = os.path.join(
+                    directory, f'{alias}.sqlite3')
+        with override_settings(CACHES=caches):
+            try:
+                yield
+            finally:
+                shutdown_thumbnail_workers()
+
+
+class IsolatedCacheRunner(DiscoverRunner):
+    """Прогон тестов со своим файлом кэша, см. `isolated_cache`."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._isolated_cache = isolated_cache()
+        self._isolated_cache.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._isolated_cache.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)